@@ -13,143 +13,1390 @@ from math import floor, ceil
 import skimage.feature
 # from sklearn.metrics import hamming_loss
 import copy
+import os
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
 
 
 def main():
     pass
 
 def image_patch(img2, slide_window, h, w):
-
-    image = img2
-    window_size = slide_window
-    patch = np.zeros((slide_window, slide_window, h, w), dtype=np.uint8)
-    
+    '''
+    (slide_window, slide_window, h, w) read-only view of every window of img2;
+    compatibility helper only, the glcm kernels index pair codes directly and do not use it
+    '''
+    # 基于步长的滑动窗口视图，与img2共享内存，不逐像素复制
     # 2,3对应的是h,w,shape反映的是数组的维数
-    for i in range(patch.shape[2]):
-        for j in range(patch.shape[3]):
-            patch[:, :, i, j] = img2[i : i + slide_window, j : j + slide_window]
- 
-    return patch   
+    patch = np.lib.stride_tricks.sliding_window_view(img2, (slide_window, slide_window))
+    return patch[:h, :w].transpose(2, 3, 0, 1)
+
+
+def iter_image_patch(img2, slide_window, h, w, block_rows=64):
+    '''
+    yield (row, patch) blocks of image_patch, patch covering rows row..row+block_rows;
+    compatibility helper only, like image_patch
+    '''
+    patch = image_patch(img2, slide_window, h, w)
+    for i in range(0, h, block_rows):
+        yield i, patch[:, :, i:i + block_rows]
+
+
+def _glcm_offset(distance, angle):
+    '''
+    pixel offset (row, col) of a glcm pair, rounded like skimage graycomatrix
+    '''
+    # 四舍五入（远离0），与graycomatrix的偏移量保持一致
+    row = np.sin(angle) * distance
+    col = np.cos(angle) * distance
+    row = int(np.copysign(np.floor(abs(row) + 0.5), row))
+    col = int(np.copysign(np.floor(abs(col) + 0.5), col))
+    return row, col
+
+
+def _offset_groups(step, angle):
+    '''
+    distinct pixel offsets of all (step, angle) pairs, in order of first use
+    returns [(offset, [(s, t), ...]), ...]
+    '''
+    # 距离较大时不同步长可能取整到同一偏移量（如45度方向步长1和2都为(1,1)），只计算一次
+    groups = {}
+    for s in range(len(step)):
+        for t in range(len(angle)):
+            groups.setdefault(_glcm_offset(step[s], angle[t]), []).append((s, t))
+    return list(groups.items())
+
+
+def _copy_offset_groups(groups, *arrays):
+    '''
+    copy the (s, t) slice computed for the first use of each offset to its other uses,
+    arrays indexed [..., s, t] at the given axis: (array, axis)
+    '''
+    for _, pos in groups:
+        s, t = pos[0]
+        for s2, t2 in pos[1:]:
+            for array, axis in arrays:
+                index = (slice(None),) * axis
+                array[index + (s2, t2)] = array[index + (s, t)]
+
+
+def _quantize(img, mi, ma, nbit):
+    '''
+    compress gray range mi..ma to 0..nbit-1
+    '''
+    bins = np.linspace(mi, ma+1, nbit+1)
+    dtype = np.uint8 if nbit <= 256 else np.uint16
+    img = np.asarray(img)
+    # 量化是单调的，只需检查最小、最大灰度值
+    lo, hi = np.digitize([img.min(), img.max()], bins) - 1
+    if lo < 0 or hi >= nbit:
+        raise ValueError(f"灰度值超出量化范围[{mi}, {ma}]")
+    if img.dtype == np.uint8:
+        # uint8影像用256项的查找表直接量化到nbit级，不生成整幅的int64临时数组
+        lut = (np.digitize(np.arange(256), bins) - 1).clip(0, nbit - 1).astype(dtype)
+        return lut[img]
+    # 其余类型按块量化，int64临时数组只有块的大小
+    img1 = np.empty(img.shape, dtype=dtype)
+    flat, out = img.reshape(-1), img1.reshape(-1)
+    for c0 in range(0, flat.size, 1 << 20):
+        out[c0:c0 + (1 << 20)] = np.digitize(flat[c0:c0 + (1 << 20)], bins) - 1
+    return img1
+
+
+def _pair_views(img2, offset):
+    '''
+    views of the first and second pixel of every pixel pair at the offset
+    '''
+    dr, dc = offset
+    H, W = img2.shape[-2:]
+    # 偏移量超过图像尺寸时没有像素对，避免负的切片终点回绕
+    ny, nx = max(0, H - abs(dr)), max(0, W - abs(dc))
+    a = img2[..., max(0, -dr):max(0, -dr) + ny, max(0, -dc):max(0, -dc) + nx]
+    b = img2[..., max(0, dr):max(0, dr) + ny, max(0, dc):max(0, dc) + nx]
+    return a, b
+
+
+def _pair_codes(img2, nbit, offset):
+    '''
+    symmetric pair code min*nbit+max of every pixel pair at the offset,
+    indexed by the position of the first pixel
+    '''
+    a, b = _pair_views(img2, offset)
+    # 对称共生矩阵中(i,j)与(j,i)计数相同，只记录较小值在前的编码
+    codes = np.minimum(a, b).astype(np.int32) * nbit
+    codes += np.maximum(a, b)
+    return codes
+
+
+def _integral_image(data, dtype):
+    '''
+    integral image with a leading zero row and column
+    '''
+    H, W = data.shape[-2:]
+    ii = np.zeros(data.shape[:-2] + (H + 1, W + 1), dtype=dtype)
+    np.cumsum(data, axis=-2, dtype=dtype, out=ii[..., 1:, 1:])
+    np.cumsum(ii[..., 1:, 1:], axis=-1, out=ii[..., 1:, 1:])
+    return ii
+
 
+def _box_sum(ii, top, left, ny, nx, h, w, at=None):
+    '''
+    sum of every ny*nx box, box (i, j) starting at (top+i, left+j);
+    at: optional (rows, cols) of the only boxes to sum, or (index, rows, cols) into a batch
+    '''
+    if at is not None:
+        lead = (Ellipsis,) + tuple(at[:-2])
+        rows, cols = at[-2] + top, at[-1] + left
+        return (ii[lead + (rows+ny, cols+nx)] - ii[lead + (rows, cols+nx)]
+                - ii[lead + (rows+ny, cols)] + ii[lead + (rows, cols)])
+    return (ii[..., top+ny:top+ny+h, left+nx:left+nx+w]
+            - ii[..., top:top+h, left+nx:left+nx+w]
+            - ii[..., top+ny:top+ny+h, left:left+w]
+            + ii[..., top:top+h, left:left+w])
 
-def calcu_glcm(img, mi, ma, nbit, slide_window, step, angle):
 
+def calcu_glcm(img, mi, ma, nbit, slide_window, step, angle, normed=True):
+    '''
+    glcm of every window, (nbit, nbit, len(step), len(angle), h, w);
+    normed=False keeps the raw counts in the narrowest unsigned integer type
+    '''
     h, w = img.shape
 
     # Compressed gray range：vmin: 0-->0, vmax: 256-1 -->nbit-1
     # 灰度量化过程256--64  64级的灰度量化的过程为0-63
     # np.linspace生成等差数列
     # np.digitize功能：返回一个和x形状相同的数据，返回值中的元素为对应x位置的元素落在bins中区间的索引号
-    bins = np.linspace(mi, ma+1, nbit+1)
-    img1 = np.digitize(img, bins) - 1
-    # img1 = np.digitize(img, bins)
+    img1 = _quantize(img, mi, ma, nbit)
 
-    # (512, 512) --> (slide_window, slide_window, 512, 512)
+    # (512, 512) --> (512+slide_window-1, 512+slide_window-1)
     img2 = cv2.copyMakeBorder(img1, floor(slide_window/2), floor(slide_window/2)
                               , floor(slide_window/2), floor(slide_window/2), cv2.BORDER_REPLICATE) # 图像扩充
-                            #   cv2.BORDER_CONSTANT, value=0) # 图像扩充
-    
-    # cv2.BORDER_REPLICATE
-    patch = np.zeros((slide_window, slide_window, h, w), dtype=np.uint8)
-    patch = image_patch(img2, slide_window, h, w)
 
-    # Calculate GLCM (5, 5, 512, 512) --> (64, 64, 512, 512)
-    # greycomatrix(image, distances, angles, levels=None, symmetric=False, normed=False)
-    # 得到共生矩阵，参数：图像矩阵，距离，方向，灰度级别，是否对称，是否标准化
-    # glcm = np.zeros((nbit, nbit, len(step), len(angle), h, w), dtype=np.uint8)
-    glcm = np.zeros((nbit, nbit, len(step), len(angle), h, w), dtype=np.float32)
-    
-    for i in range(patch.shape[2]):
-        for j in range(patch.shape[3]):
-            # glcm[:, :, :, :, i, j]= greycomatrix(patch[:, :, i, j], step, angle, levels=nbit,symmetric=True,normed=True)False
-            glcm[:, :, :, :, i, j]= skimage.feature.graycomatrix(patch[:, :, i, j], step, angle, levels=nbit,symmetric=True,normed=True)
+    return _calcu_glcm_padded(img2, nbit, slide_window, step, angle, h, w, normed=normed)
+
+
+def calcu_glcm_packed(img, mi, ma, nbit, slide_window, step, angle, normed=True):
+    '''
+    calcu_glcm stored as a PackedGLCM, half the memory of the full glcm
+    '''
+    h, w = img.shape
+    img1 = _quantize(img, mi, ma, nbit)
+    pad = floor(slide_window/2)
+    img2 = cv2.copyMakeBorder(img1, pad, pad, pad, pad, cv2.BORDER_REPLICATE) # 图像扩充
+    return _calcu_glcm_padded(img2, nbit, slide_window, step, angle, h, w, packed=True, normed=normed)
+
+
+def _count_dtype(max_count):
+    '''
+    narrowest unsigned integer type holding max_count
+    '''
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_count <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
+
+
+def _tri_index(nbit):
+    '''
+    packed upper-triangle index (np.triu_indices order) of every pair code i*nbit+j, i<=j
+    '''
+    i, j = np.triu_indices(nbit)
+    index = np.full(nbit * nbit, -1, dtype=np.intp)
+    index[i * nbit + j] = np.arange(len(i))
+    return index
+
+
+class PackedGLCM:
+    '''
+    symmetric glcm stored as its upper triangle
+    values: (nbit*(nbit+1)/2, ...) in np.triu_indices order, values[k] being
+            both glcm[i, j] and glcm[j, i]
+    total: None if values are normed, otherwise values are integer counts and
+           total (len(step), len(angle)) is the glcm sum of a window
+    '''
+    def __init__(self, values, nbit, total=None):
+        self.values = values
+        self.nbit = nbit
+        self.total = total
+
+    @property
+    def shape(self):
+        return (self.nbit, self.nbit) + self.values.shape[1:]
+
+    def to_dense(self):
+        '''
+        full (nbit, nbit, ...) glcm, as calcu_glcm returns (with the same normed)
+        '''
+        glcm = np.empty(self.shape, dtype=self.values.dtype)
+        i, j = np.triu_indices(self.nbit)
+        glcm[i, j] = self.values
+        glcm[j, i] = self.values
+        return glcm
+
+
+def _calcu_glcm_padded(img2, nbit, slide_window, step, angle, h, w, packed=False, normed=True):
+    '''
+    glcm of every window of a quantized image already padded by slide_window//2,
+    window (i, j) covering img2[i:i+slide_window, j:j+slide_window];
+    packed: return a PackedGLCM, only the upper triangle is counted
+    normed: False keeps integer counts, normalization is left to calcu_glcm_features
+    '''
+    # Calculate GLCM (64, 64, len(step), len(angle), 512, 512)
+    # 不再逐像素调用graycomatrix：对每个偏移量计算整幅图像的像素对编码，
+    # 窗口内每个像素对位置对应一个平移后的编码数组，累加到所有窗口的共生矩阵中
+    # 计数不超过窗口内像素对个数的2倍（对角线单元），不归一化时用能容纳它的最窄整数类型
+    dtype = np.float32 if normed else _count_dtype(2 * slide_window * slide_window)
+    if packed:
+        # 对称矩阵只保存上三角，对角线单元计数为像素对个数的2倍
+        tri = _tri_index(nbit)
+        glcm = np.zeros((nbit * (nbit + 1) // 2, len(step), len(angle), h, w), dtype=dtype)
+    else:
+        glcm = np.zeros((nbit, nbit, len(step), len(angle), h, w), dtype=dtype)
+    glcm_flat = glcm.reshape(-1)
+    stride = len(step) * len(angle) * h * w
+    totals = np.zeros((len(step), len(angle)), dtype=np.int64)
+
+    # 相同的偏移量只计数一次，最后复制到其余的(step, angle)位置
+    groups = _offset_groups(step, angle)
+    for (dr, dc), pos in groups:
+        s, t = pos[0]
+        # 窗口内该偏移量的像素对个数，所有窗口相同
+        ny, nx = slide_window - abs(dr), slide_window - abs(dc)
+        if ny <= 0 or nx <= 0:
+            continue
+        total = 2.0 * ny * nx
+        totals[s, t] = 2 * ny * nx
+        if not normed:
+            # 不归一化时计数与原始像素对个数一致，对角线单元最后统一乘2
+            total = 1
+
+        codes = _pair_codes(img2, nbit, (dr, dc)).astype(np.intp)
+        uniq = np.unique(codes)
+
+        if len(uniq) < 4 * ny * nx:
+            # 出现的像素对种类较少（少于逐位置累加的次数）时，逐种编码用积分图统计窗口计数
+            for code in uniq:
+                i, j = divmod(int(code), nbit)
+                ii = _integral_image(codes == code, np.int32)
+                count = _box_sum(ii, 0, 0, ny, nx, h, w)
+                if packed:
+                    glcm[tri[code], s, t] = (2 if i == j else 1) * count / total
+                elif i == j:
+                    glcm[i, i, s, t] = 2 * count / total
+                else:
+                    glcm[i, j, s, t] = count / total
+                    glcm[j, i, s, t] = glcm[i, j, s, t]
+            continue
 
+        base = (s * len(angle) + t) * h * w + np.arange(h * w)
+        # (i,j)对应的转置位置(j,i)，symmetric=True时两者都计数；只保存上三角时对角线最后乘2
+        cells = (tri[codes],) if packed else (codes, (codes % nbit) * nbit + codes // nbit)
+        sign = 1
+        if normed and 2 * ny * nx * 64 < nbit * nbit:
+            # 窗口内像素对很少时共生矩阵几乎全为0：先以负数计数，再只改写出现过的单元，
+            # 不遍历整个nbit*nbit矩阵
+            sign = -1
+        # 整数计数直接累加，同一次累加中每个窗口只取一个位置，索引不重复
+        for y in range(ny):
+            for x in range(nx):
+                for c in cells:
+                    glcm_flat[c[y:y+h, x:x+w].ravel() * stride + base] += sign
+        if sign < 0:
+            for y in range(ny):
+                for x in range(nx):
+                    for c in cells:
+                        idx = c[y:y+h, x:x+w].ravel() * stride + base
+                        idx = idx[glcm_flat[idx] < 0]
+                        glcm_flat[idx] = glcm_flat[idx] / -total
+        elif normed:
+            # 其余情况每个偏移量整体除一次像素对总数
+            glcm[..., s, t, :, :] /= total
+        if packed:
+            diagonal = np.unique(tri[uniq[uniq // nbit == uniq % nbit]])
+            glcm[diagonal, s, t] *= 2
+
+    _copy_offset_groups(groups, (glcm, 1 if packed else 2), (totals, 0))
+    if packed:
+        return PackedGLCM(glcm, nbit, None if normed else totals)
     return glcm
 
+def calcu_glcm_plot(img, mi, ma, nbit, step, angle, mask=None):
+    '''
+    one symmetric normed glcm of the whole image per step and angle, as
+    graycomatrix(symmetric=True, normed=True) of the quantized image;
+    img may be a batch (n, h, w) of equal-size images, one glcm each
+    mask: optional validity mask, only pairs with both pixels inside it are counted
+    returns (nbit, nbit, len(step), len(angle)) float64, (..., n) for a batch
+    '''
+    img1 = _quantize(img, mi, ma, nbit)
+    if mask is not None and mask.shape != img.shape:
+        raise ValueError("掩膜与图像尺寸不一致")
+
+    # 批量计算时第k幅图像的编码加上k*nbit*nbit，所有图像只需一次bincount
+    n = 1 if img.ndim == 2 else img.shape[0]
+    batch_base = (np.arange(n, dtype=np.int64) * (nbit * nbit)).reshape((-1,) + (1,) * (img.ndim - 1))
+    glcm = np.zeros((nbit, nbit, len(step), len(angle), n), dtype=np.float64)
+    groups = _offset_groups(step, angle)
+    for offset, pos in groups:
+        s, t = pos[0]
+        codes = _pair_codes(img1, nbit, offset)
+        if img.ndim > 2:
+            codes = codes + batch_base
+        if mask is not None:
+            a, b = _pair_views(mask, offset)
+            codes = codes[a & b]
+        # 编码只记录较小灰度级在前的单元，加上转置得到对称矩阵（对角线计2次）
+        counts = np.bincount(codes.ravel(), minlength=n * nbit * nbit).reshape(n, nbit, nbit)
+        counts = counts + counts.transpose(0, 2, 1)
+        glcm[:, :, s, t] = (counts / np.maximum(counts.sum(axis=(1, 2), keepdims=True), 1)).transpose(1, 2, 0)
+    _copy_offset_groups(groups, (glcm, 2))
+    return glcm if img.ndim > 2 else glcm[..., 0]
+
+
+# 小窗口使用稀疏共生矩阵的最大窗口尺寸
+SPARSE_MAX_WINDOW = 9
+
+
+class SparseGLCM:
+    '''
+    symmetric glcm of every window as a sorted list of pair codes min*nbit+max with counts
+    codes, counts: (len(step), len(angle), h, w, K), K the most pixel pairs in a window,
+                   entries after the last pair code of a window have count 0
+    total: (len(step), len(angle)) glcm sum of a window before normalization (2 * pixel pairs)
+    '''
+    def __init__(self, codes, counts, total, nbit):
+        self.codes = codes
+        self.counts = counts
+        self.total = total
+        self.nbit = nbit
+
+    @property
+    def shape(self):
+        return (self.nbit, self.nbit) + self.codes.shape[:4]
+
+    def to_dense(self):
+        '''
+        normed (nbit, nbit, len(step), len(angle), h, w) float32 glcm, as calcu_glcm returns
+        '''
+        glcm = np.zeros(self.shape, dtype=np.float32)
+        s, t, y, x, k = np.nonzero(self.counts)
+        i, j = np.divmod(self.codes[s, t, y, x, k].astype(np.intp), self.nbit)
+        # 非对角线(i,j)、(j,i)两个单元计数均为n，对角线单元计数为2n
+        value = np.where(i == j, 2, 1) * self.counts[s, t, y, x, k] / self.total[s, t]
+        glcm[i, j, s, t, y, x] = value
+        glcm[j, i, s, t, y, x] = value
+        return glcm
+
+
+def calcu_glcm_sparse(img, mi, ma, nbit, slide_window, step, angle, block_rows=64):
+    '''
+    symmetric normed glcm of every window as a SparseGLCM,
+    for small windows where almost all of the nbit*nbit cells are 0
+    '''
+    h, w = img.shape
+    img1 = _quantize(img, mi, ma, nbit)
+    pad = floor(slide_window/2)
+    img2 = cv2.copyMakeBorder(img1, pad, pad, pad, pad, cv2.BORDER_REPLICATE) # 图像扩充
+    return _calcu_glcm_sparse_padded(img2, nbit, slide_window, step, angle, h, w, block_rows)
+
+
+def _calcu_glcm_sparse_padded(img2, nbit, slide_window, step, angle, h, w, block_rows=64):
+    '''
+    calcu_glcm_sparse of a quantized image already padded by slide_window//2,
+    window (i, j) covering img2[i:i+slide_window, j:j+slide_window]
+    '''
+    groups = _offset_groups(step, angle)
+    sizes = [(slide_window - abs(dr), slide_window - abs(dc)) for (dr, dc), _ in groups]
+    K = max([ny * nx for ny, nx in sizes if ny > 0 and nx > 0] + [1])
+
+    codes = np.zeros((len(step), len(angle), h, w, K), dtype=np.uint16 if nbit <= 256 else np.int32)
+    counts = np.zeros((len(step), len(angle), h, w, K), dtype=np.uint16)
+    total = np.zeros((len(step), len(angle)), dtype=np.int64)
+    for (dr, dc), pos in groups:
+        s, t = pos[0]
+        ny, nx = slide_window - abs(dr), slide_window - abs(dc)
+        if ny <= 0 or nx <= 0:
+            continue
+        total[s, t] = 2 * ny * nx
+        pair_codes = _pair_codes(img2, nbit, (dr, dc))
+        # 按行分块，每个窗口的像素对编码排序后合并相同编码
+        for r0 in range(0, h, block_rows):
+            rows = min(block_rows, h - r0)
+            windows = np.lib.stride_tricks.sliding_window_view(
+                pair_codes[r0:r0 + rows + ny - 1, :w + nx - 1], (ny, nx))
+            sorted_codes = np.sort(windows.reshape(rows * w, ny * nx), axis=-1)
+            new = np.ones(sorted_codes.shape, dtype=bool)
+            new[:, 1:] = sorted_codes[:, 1:] != sorted_codes[:, :-1]
+            rank = np.cumsum(new, axis=-1) - 1
+            flat = (np.arange(rows * w)[:, None] * K + rank).ravel()
+            block_counts = np.bincount(flat, minlength=rows * w * K)
+            block_codes = np.zeros(rows * w * K, dtype=codes.dtype)
+            block_codes[flat] = sorted_codes.ravel()
+            codes[s, t, r0:r0 + rows] = block_codes.reshape(rows, w, K)
+            counts[s, t, r0:r0 + rows] = block_counts.reshape(rows, w, K)
+
+    _copy_offset_groups(groups, (codes, 0), (counts, 0), (total, 0))
+    return SparseGLCM(codes, counts, total, nbit)
+
+
+# 纹理特征：均值、方差、同质性、对比度、相异性、熵、相关性、二阶矩
+GLCM_FEATURES = ("MEA", "VAR", "HOM", "CON", "DIS", "ENT", "COR", "SEM")
+
+
+def calcu_glcm_features(glcm, nbit, features=GLCM_FEATURES):
+    '''
+    calc several glcm features in one pass, glcm shape (nbit, nbit, ...),
+    normed or integer counts (calcu_glcm normed=False), or a SparseGLCM / PackedGLCM
+    returns {feature: array of shape glcm.shape[2:]}
+    '''
+    for feature in features:
+        if feature not in GLCM_FEATURES:
+            raise ValueError(f"未知的纹理特征: {feature}")
+    if isinstance(glcm, SparseGLCM):
+        return _sparse_glcm_features(glcm, features)
+    if isinstance(glcm, PackedGLCM):
+        return _packed_glcm_features(glcm, features)
+
+    eps = 0.00001
+    shape = glcm.shape[2:]
+    glcm = glcm.reshape(nbit, nbit, -1)
+    n = glcm.shape[2]
+    counted = np.issubdtype(glcm.dtype, np.integer)
+
+    # 权重矩阵只构建一次：|i-j|, (i-j)^2, 1/(1+(i-j)^2), i*j
+    level = np.arange(nbit, dtype=np.float64)
+    i, j = np.meshgrid(level, level, indexing='ij')
+    weights = {
+        "HOM": 1. / (1. + (i - j)**2),
+        "CON": (i - j)**2,
+        "DIS": np.abs(i - j),
+        "COR": i * j,
+    }
+    linear = [f for f in weights if f in features and f != "COR"]
+    if linear:
+        w = np.stack([weights[f].ravel() for f in linear])
+
+    results = {f: np.zeros(n, dtype=np.float32) for f in features}
+    cor_weight = weights["COR"].ravel()
+
+    # 按像素分块，限制临时数组大小
+    chunk = max(1, (1 << 22) // (nbit * nbit))
+    for c0 in range(0, n, chunk):
+        c1 = min(n, c0 + chunk)
+        g = glcm[:, :, c0:c1]
+        if counted:
+            # 整数计数的共生矩阵在此按窗口归一化
+            g = (g / np.maximum(g.sum(axis=(0, 1), dtype=np.int64), 1)).astype(np.float32)
+        g_flat = g.reshape(nbit * nbit, -1)
+
+        # 线性特征合并为一次张量收缩
+        if linear:
+            sums = w.astype(g_flat.dtype) @ g_flat
+            for k, feature in enumerate(linear):
+                results[feature][c0:c1] = sums[k]
+
+        # 边缘分布：均值和方差由MEA、VAR、COR共用，用float64累加避免相关性中的相消误差
+        if any(f in features for f in ("MEA", "VAR", "COR")):
+            px = g.sum(axis=1, dtype=np.float64)
+            mean_x = level @ px
+            variance_x = ((level[:, None] - mean_x)**2 * px).sum(axis=0)
+            if "MEA" in features:
+                results["MEA"][c0:c1] = mean_x
+            if "VAR" in features:
+                results["VAR"][c0:c1] = variance_x
+            if "COR" in features:
+                py = g.sum(axis=0, dtype=np.float64)
+                mean_y = level @ py
+                variance_y = ((level[:, None] - mean_y)**2 * py).sum(axis=0)
+                ppo = np.einsum('k,kn->n', cor_weight, g_flat, dtype=np.float64)
+                results["COR"][c0:c1] = (ppo - mean_x * mean_y) / (np.sqrt(variance_x) * np.sqrt(variance_y) + eps)
+
+        # 熵：p=0时p*log(p)按0计，不修改输入的glcm
+        if "ENT" in features:
+            log_g = np.log(g_flat, out=np.zeros_like(g_flat), where=g_flat > 0)
+            results["ENT"][c0:c1] = -np.einsum('kn,kn->n', g_flat, log_g)
+
+        if "SEM" in features:
+            results["SEM"][c0:c1] = np.einsum('kn,kn->n', g_flat, g_flat)
+
+    return {f: results[f].reshape(shape) for f in features}
+
+
+def _packed_glcm_features(glcm, features):
+    '''
+    calcu_glcm_features of a PackedGLCM, off-diagonal cells weighted twice;
+    integer counts are normalized inside the formulas, once per window
+    '''
+    eps = 0.00001
+    nbit = glcm.nbit
+    shape = glcm.values.shape[1:]
+    values = glcm.values.reshape(glcm.values.shape[0], -1)
+    n = values.shape[1]
+    counted = glcm.total is not None
+
+    i, j = np.triu_indices(nbit)
+    # 上三角的非对角线单元代表(i,j)和(j,i)两个单元
+    cells = np.where(i == j, 1., 2.)
+    i, j = i.astype(np.float64), j.astype(np.float64)
+    weights = {
+        "HOM": cells / (1. + (i - j)**2),
+        "CON": cells * (i - j)**2,
+        "DIS": cells * np.abs(i - j),
+    }
+    linear = [f for f in weights if f in features]
+    if linear:
+        w = np.stack([weights[f] for f in linear])
+        if not counted:
+            w = w.astype(values.dtype)
+    # 边缘分布px[l] = sum_k g[l, k]：三角单元(i,j)计入px[i]和px[j]，对角线单元只计一次
+    level = np.arange(nbit, dtype=np.float64)
+    marginal = np.zeros((nbit, len(i)))
+    marginal[i.astype(np.intp), np.arange(len(i))] += 1
+    marginal[j.astype(np.intp), np.arange(len(i))] += cells - 1
+    cor_weight = cells * i * j
+
+    if counted:
+        # 整数计数：各特征先对计数累加，再按窗口的计数总和归一化；
+        # 跳过的偏移量总和为0，按1处理使特征为0，与归一化的空矩阵一致
+        total = np.repeat(np.maximum(glcm.total.reshape(-1), 1).astype(np.float64), n // glcm.total.size)
+        xlogx = np.arange(int(values.max(initial=0)) + 1, dtype=np.float64)
+        xlogx[1:] *= np.log(xlogx[1:])
+
+    results = {f: np.zeros(n, dtype=np.float32) for f in features}
+    chunk = max(1, (1 << 22) // len(i))
+    for c0 in range(0, n, chunk):
+        c1 = min(n, c0 + chunk)
+        g = values[:, c0:c1]
+        if counted:
+            g64 = g.astype(np.float64)
+            norm = total[c0:c1]
+        else:
+            norm = 1.
+
+        if linear:
+            sums = w @ (g64 if counted else g)
+            for k, feature in enumerate(linear):
+                results[feature][c0:c1] = sums[k] / norm
+
+        if any(f in features for f in ("MEA", "VAR", "COR")):
+            if not counted:
+                g64 = g.astype(np.float64)
+            px = marginal @ g64 / norm
+            mean = level @ px
+            variance = ((level[:, None] - mean)**2 * px).sum(axis=0)
+            if "MEA" in features:
+                results["MEA"][c0:c1] = mean
+            if "VAR" in features:
+                results["VAR"][c0:c1] = variance
+            if "COR" in features:
+                # 对称矩阵两个方向的均值、方差相同
+                ppo = cor_weight @ g64 / norm
+                results["COR"][c0:c1] = (ppo - mean * mean) / (np.sqrt(variance) * np.sqrt(variance) + eps)
+
+        if counted:
+            if "ENT" in features:
+                # -sum(c/M*log(c/M)) = log(M) - sum(c*log(c))/M，计数的c*log(c)查表得到
+                entropy = np.log(norm) - cells @ xlogx[g] / norm
+                entropy[entropy < 1e-9] = 0
+                results["ENT"][c0:c1] = entropy
+            if "SEM" in features:
+                results["SEM"][c0:c1] = cells @ (g64 * g64) / (norm * norm)
+            continue
+
+        if "ENT" in features:
+            log_g = np.log(g, out=np.zeros_like(g), where=g > 0)
+            results["ENT"][c0:c1] = -(cells.astype(g.dtype) @ (g * log_g))
+        if "SEM" in features:
+            results["SEM"][c0:c1] = cells.astype(g.dtype) @ (g * g)
+
+    return {f: results[f].reshape(shape) for f in features}
+
+
+def _sparse_glcm_features(glcm, features):
+    '''
+    calcu_glcm_features of a SparseGLCM, straight from the pair code lists
+    '''
+    eps = 0.00001
+    S, A, h, w, K = glcm.codes.shape
+    codes = glcm.codes.reshape(S * A, -1, K)
+    counts = glcm.counts.reshape(S * A, -1, K)
+    results = {f: np.zeros((S * A, h * w), dtype=np.float32) for f in features}
+
+    chunk = max(1, (1 << 20) // K)
+    for o in range(S * A):
+        total = float(glcm.total.flat[o])
+        if total == 0:
+            continue
+        for c0 in range(0, h * w, chunk):
+            c1 = min(h * w, c0 + chunk)
+            i, j = np.divmod(codes[o, c0:c1].astype(np.int64), glcm.nbit)
+            # 每个编码(i<=j)代表单元(i,j)和(j,i)，非对角线两个单元概率均为p，对角线单元概率为2p，
+            # 因此对称权重f(i,j)的加权和为sum(2p*f)，边缘分布的矩为sum(p*(f(i)+f(j)))
+            p = counts[o, c0:c1] / total
+            if "HOM" in features:
+                results["HOM"][o, c0:c1] = (2 * p / (1. + (i - j)**2)).sum(axis=1)
+            if "CON" in features:
+                results["CON"][o, c0:c1] = (2 * p * (i - j)**2).sum(axis=1)
+            if "DIS" in features:
+                results["DIS"][o, c0:c1] = (2 * p * np.abs(i - j)).sum(axis=1)
+
+            if any(f in features for f in ("MEA", "VAR", "COR")):
+                mean = (p * (i + j)).sum(axis=1)
+                variance = (p * ((i - mean[:, None])**2 + (j - mean[:, None])**2)).sum(axis=1)
+                if "MEA" in features:
+                    results["MEA"][o, c0:c1] = mean
+                if "VAR" in features:
+                    results["VAR"][o, c0:c1] = variance
+                if "COR" in features:
+                    ppo = (2 * p * i * j).sum(axis=1)
+                    results["COR"][o, c0:c1] = (ppo - mean * mean) / (variance + eps)
+
+            if "ENT" in features or "SEM" in features:
+                diagonal = i == j
+                cell = np.where(diagonal, 2 * p, p)
+                cells = np.where(diagonal, 1, 2)
+                if "ENT" in features:
+                    log_cell = np.log(cell, out=np.zeros_like(cell), where=cell > 0)
+                    results["ENT"][o, c0:c1] = -(cells * cell * log_cell).sum(axis=1)
+                if "SEM" in features:
+                    results["SEM"][o, c0:c1] = (cells * cell * cell).sum(axis=1)
+
+    return {f: results[f].reshape(S, A, h, w) for f in features}
+
+
+def _rolling_counts(codes, nbit, boxes, h, w):
+    '''
+    sum(c^2) and sum(c*log c) over the glcm cells of every window of pair codes,
+    updated column by column with a rolling histogram per output row;
+    all boxes slide together, see _direct_features for boxes;
+    codes may be a batch (n, H, W), the rows of all images slide together
+    returns one (square_sum, xlogx_sum) per box
+    '''
+    # 沿较短的一边滑动，减少循环次数
+    if w > h:
+        counts = _rolling_counts(np.ascontiguousarray(np.swapaxes(codes, -1, -2)), nbit,
+                                 [(left, top, nx, ny) for top, left, ny, nx in boxes], w, h)
+        return [(np.swapaxes(square_sum, -1, -2), np.swapaxes(xlogx_sum, -1, -2))
+                for square_sum, xlogx_sum in counts]
+
+    lead = codes.shape[:-2]
+    codes = codes.reshape((-1,) + codes.shape[-2:])
+    n = len(codes)
+    # 每幅图像的每个输出行各一个直方图，批量过大时分成两半，限制直方图内存（约128MB）
+    if n > 1 and len(boxes) * n * h * nbit * nbit * 2 > (1 << 27):
+        parts = [_rolling_counts(codes[:n // 2], nbit, boxes, h, w),
+                 _rolling_counts(codes[n // 2:], nbit, boxes, h, w)]
+        return [tuple(np.concatenate([part[k][i] for part in parts]).reshape(lead + (h, w)) for i in range(2))
+                for k in range(len(boxes))]
+
+    n_max = max(ny * nx for _, _, ny, nx in boxes)
+    xlogx = np.arange(2 * n_max + 1, dtype=np.float64)
+    xlogx[1:] *= np.log(xlogx[1:])
+    count = np.arange(n_max + 1)
+    # 非对角线(i,j)、(j,i)两个单元计数均为n，对角线单元计数为2n
+    cell_xlogx = np.stack([2 * xlogx[count], xlogx[2 * count]])
+    cell_square = np.array([2, 4], dtype=np.int64)
+
+    # 每个窗口尺寸的每个输出行一个直方图，按ny从大到小排列，
+    # 第y行像素对参与更新的直方图恰好是前若干个
+    order = sorted(range(len(boxes)), key=lambda k: -boxes[k][2])
+    ny_max = boxes[order[0]][2]
+    height, width = codes.shape[1:]
+    codes_flat = codes.ravel()
+    diagonal_flat = (codes_flat // nbit == codes_flat % nbit).astype(np.intp)
+    # 批量时各幅图像的编码首尾相接，第k幅的第r行为整体的第k*height+r行
+    rows = (np.arange(n)[:, None] * height + np.arange(h)).ravel()
+    nh = n * h
+    base = np.concatenate([(boxes[k][0] + rows) * width + boxes[k][1] for k in order])
+    nx_rows = np.repeat([boxes[k][3] for k in order], nh)
+    ny_rows = np.repeat([boxes[k][2] for k in order], nh)
+    n_rows = [nh * sum(1 for k in order if boxes[k][2] > y) for y in range(ny_max)]
+    hist_base = np.arange(len(boxes) * nh, dtype=np.int64) * (nbit * nbit)
+
+    hist = np.zeros(len(boxes) * nh * nbit * nbit, dtype=np.uint16 if n_max < 65536 else np.uint32)
+    square_row = np.zeros(len(boxes) * nh, dtype=np.int64)
+    xlogx_row = np.zeros(len(boxes) * nh, dtype=np.float64)
+    square_sum = np.zeros((len(boxes) * nh, w), dtype=np.int64)
+    xlogx_sum = np.zeros((len(boxes) * nh, w), dtype=np.float64)
+
+    def update(sel, pos, sign):
+        # 每个直方图只取一个编码，同一次更新中索引不重复
+        code = codes_flat[pos]
+        diag = diagonal_flat[pos]
+        idx = hist_base[sel] + code
+        old = hist[idx].astype(np.int64)
+        new = old + sign
+        hist[idx] = new
+        square_row[sel] += cell_square[diag] * (new * new - old * old)
+        xlogx_row[sel] += cell_xlogx[diag, new] - cell_xlogx[diag, old]
+
+    # 第一列窗口
+    for x in range(max(nx for _, _, _, nx in boxes)):
+        for y in range(ny_max):
+            sel = np.nonzero((ny_rows > y) & (nx_rows > x))[0]
+            update(sel, base[sel] + y * width + x, 1)
+    square_sum[:, 0] = square_row
+    xlogx_sum[:, 0] = xlogx_row
+
+    for j in range(1, w):
+        # 移出左侧一列、移入右侧一列，每步只需O(窗口边长)次更新，所有窗口尺寸同时进行
+        for y in range(ny_max):
+            sel = slice(0, n_rows[y])
+            pos = base[sel] + (y * width + j - 1)
+            update(sel, pos, -1)
+            update(sel, pos + nx_rows[sel], 1)
+        square_sum[:, j] = square_row
+        xlogx_sum[:, j] = xlogx_row
+
+    counts = [None] * len(boxes)
+    for r, k in enumerate(order):
+        counts[k] = (square_sum[r*nh:(r+1)*nh].reshape(lead + (h, w)),
+                     xlogx_sum[r*nh:(r+1)*nh].reshape(lead + (h, w)))
+    return counts
+
+
+def _direct_features(codes, nbit, boxes, h, w, features, method='auto', at=None):
+    '''
+    glcm features of every window of pair codes, without building the glcm
+    boxes: list of (top, left, ny, nx), window (i, j) of a box covering
+           codes[top+i:top+i+ny, left+j:left+j+nx]; the integral images are shared by all boxes
+    method: 'integral' counts each pair code with integral images,
+            'rolling' slides a histogram along the rows, 'auto' picks the cheaper one
+    at: optional list of (rows, cols) per box, only those windows are computed
+    codes may be a batch (n, H, W), at then holds (index, rows, cols)
+    returns one {feature: (h, w) array} per box, (n, h, w) for a batch, 1-D arrays along at when given
+    '''
+    eps = 0.00001
+    lo = (codes // nbit).astype(np.int64)
+    hi = (codes % nbit).astype(np.int64)
+    results = [{} for _ in boxes]
+    if at is None:
+        at = [None] * len(boxes)
+
+    def window_sums(data, dtype=np.int64):
+        ii = _integral_image(data, dtype)
+        return [_box_sum(ii, top, left, ny, nx, h, w, a) for (top, left, ny, nx), a in zip(boxes, at)]
+
+    # 线性特征：对称共生矩阵中每个像素对(a,b)贡献(a,b)和(b,a)两个单元，
+    # 特征值等于窗口内逐像素对权重之和除以像素对个数
+    if "CON" in features:
+        for k, sums in enumerate(window_sums((hi - lo)**2)):
+            results[k]["CON"] = sums / (boxes[k][2] * boxes[k][3])
+    if "DIS" in features:
+        for k, sums in enumerate(window_sums(hi - lo)):
+            results[k]["DIS"] = sums / (boxes[k][2] * boxes[k][3])
+    if "HOM" in features:
+        for k, sums in enumerate(window_sums(1. / (1. + (hi - lo)**2), np.float64)):
+            results[k]["HOM"] = sums / (boxes[k][2] * boxes[k][3])
+
+    if any(f in features for f in ("MEA", "VAR", "COR")):
+        # 整数累加，方差、协方差的分子精确计算
+        s1 = window_sums(lo + hi)
+        s2 = window_sums(lo**2 + hi**2)
+        sp = window_sums(lo * hi) if "COR" in features else None
+        for k in range(len(boxes)):
+            total = 2 * boxes[k][2] * boxes[k][3]
+            results[k]["MEA"] = s1[k] / total
+            variance = (total * s2[k] - s1[k]**2) / float(total)**2
+            results[k]["VAR"] = variance
+            if "COR" in features:
+                covariance = (2 * total * sp[k] - s1[k]**2) / float(total)**2
+                results[k]["COR"] = covariance / (variance + eps)
+
+    # 熵和二阶矩与单元计数非线性相关
+    if "ENT" in features or "SEM" in features:
+        uniq = np.unique(codes)
+        if method == 'auto':
+            # 积分图方式的代价与出现的编码种类数成正比（每种编码的积分图被所有窗口共用），
+            # 滑动直方图与窗口边长成正比（每个窗口尺寸单独滑动）
+            # 只计算部分窗口时，积分图方式的取值代价随之减少
+            rolling_cost = 36 * sum(ny for _, _, ny, _ in boxes)
+            n_windows = float(h * w) * (codes.size // (codes.shape[-2] * codes.shape[-1]))
+            n_sums = sum(1 if a is None else len(a[0]) / n_windows for a in at)
+            method = 'rolling' if len(uniq) * (2 + n_sums) > rolling_cost else 'integral'
+
+        if method == 'rolling':
+            counts = _rolling_counts(codes, nbit, boxes, h, w)
+            counts = [(square_sum, xlogx_sum) if a is None else (square_sum[a], xlogx_sum[a])
+                      for (square_sum, xlogx_sum), a in zip(counts, at)]
+        else:
+            # 逐种出现的像素对编码统计窗口计数并累加
+            xlogx = np.arange(2 * max(ny * nx for _, _, ny, nx in boxes) + 1, dtype=np.float64)
+            xlogx[1:] *= np.log(xlogx[1:])
+            shapes = [codes.shape[:-2] + (h, w) if a is None else a[0].shape for a in at]
+            counts = [(np.zeros(shape, dtype=np.int64), np.zeros(shape, dtype=np.float64))
+                      for shape in shapes]
+            for code in uniq:
+                diagonal = code // nbit == code % nbit
+                for (square_sum, xlogx_sum), count in zip(counts, window_sums(codes == code, np.int32)):
+                    if diagonal:
+                        # 对角线单元计数为2n
+                        square_sum += 4 * count.astype(np.int64)**2
+                        xlogx_sum += xlogx[2 * count]
+                    else:
+                        # 非对角线(i,j)、(j,i)两个单元计数均为n
+                        square_sum += 2 * count.astype(np.int64)**2
+                        xlogx_sum += 2 * xlogx[count]
+
+        for k, (square_sum, xlogx_sum) in enumerate(counts):
+            total = 2 * boxes[k][2] * boxes[k][3]
+            # -sum(c/M*log(c/M)) = log(M) - sum(c*log(c))/M
+            entropy = np.log(total) - xlogx_sum / total
+            # 窗口内只有一种像素对时熵应严格为0（Edge_Remove依赖该值），消除累加误差
+            # 其余情况熵不小于log(M)/M，远大于误差
+            entropy[entropy < 1e-9] = 0
+            results[k]["ENT"] = entropy
+            results[k]["SEM"] = square_sum / float(total)**2
+
+    return [{f: result[f] for f in features} for result in results]
+
+
+def valid_window_mask(mask, slide_window):
+    '''
+    True where the whole slide_window*slide_window window lies inside the mask,
+    pixels outside the image counted like BORDER_REPLICATE
+    '''
+    # 图像外的像素按有效处理，与复制边界等价
+    return erode_mask(mask, floor(slide_window/2), border_valid=True)
+
+
+def mask_bbox(mask, margin=0):
+    '''
+    (top, bottom, left, right) bounding box of the mask, None if it is empty
+    margin: widen the box by this many pixels on each side, clipped to the mask shape
+    '''
+    rows = np.flatnonzero(np.any(mask, axis=1))
+    cols = np.flatnonzero(np.any(mask, axis=0))
+    if len(rows) == 0:
+        return None
+    H, W = mask.shape
+    return (max(0, rows[0] - margin), min(H, rows[-1] + 1 + margin),
+            max(0, cols[0] - margin), min(W, cols[-1] + 1 + margin))
+
+
+def calcu_glcm_direct_multiwindow(img, mi, ma, nbit, slide_windows, step, angle, features=GLCM_FEATURES,
+                                  method='auto', mask=None):
+    '''
+    calc glcm features of every window for several window sizes at once:
+    the image is quantized and padded once, and each offset's pair codes
+    and integral images are shared by all window sizes
+    mask: optional (h, w) validity mask (nodata or plot polygon); only windows lying
+          wholly inside it are computed, the other results are NaN
+    returns {slide_window: {feature: array of shape (len(step), len(angle), h, w)}}
+    '''
+    for feature in features:
+        if feature not in GLCM_FEATURES:
+            raise ValueError(f"未知的纹理特征: {feature}")
+
+    h, w = img.shape
+    # 按最大窗口扩充一次，小窗口从中截取，边界与各自单独扩充时相同
+    pad = floor(max(slide_windows)/2)
+    if mask is None:
+        img1 = _quantize(img, mi, ma, nbit)
+        img2 = cv2.copyMakeBorder(img1, pad, pad, pad, pad, cv2.BORDER_REPLICATE) # 图像扩充
+        return _direct_multiwindow_padded(img2, pad, nbit, slide_windows, step, angle, features, method, h, w)
+
+    if mask.shape != img.shape:
+        raise ValueError("掩膜与图像尺寸不一致")
+    results = {sw: {f: np.full((len(step), len(angle), h, w), np.nan, dtype=np.float32) for f in features}
+               for sw in slide_windows}
+    bbox = mask_bbox(mask)
+    if bbox is None:
+        return results
+
+    # 只计算掩膜外接矩形内的窗口，矩形外的窗口必然超出掩膜
+    top, bottom, left, right = bbox
+    img2 = _quantize(_read_tile_padded(img, top, left, bottom - top, right - left, pad), mi, ma, nbit)
+    mask2 = _read_tile_padded(mask, top, left, bottom - top, right - left, pad)
+    window_maps = _direct_multiwindow_padded(img2, pad, nbit, slide_windows, step, angle, features, method,
+                                             bottom - top, right - left, mask2)
+    for sw, feature_maps in window_maps.items():
+        for feature, values in feature_maps.items():
+            results[sw][feature][:, :, top:bottom, left:right] = values
+    return results
+
+
+def _direct_multiwindow_padded(img2, pad, nbit, slide_windows, step, angle, features, method, h, w, mask2=None):
+    '''
+    calcu_glcm_direct_multiwindow on a quantized image already padded by pad,
+    pad being at least max(slide_windows)//2; mask2 is the validity mask padded the same way;
+    img2 may be a batch (n, H, W), the maps are then (len(step), len(angle), n, h, w)
+    '''
+    # 有掩膜时只计算完全位于掩膜内的窗口，其余位置为NaN
+    inner, at = {}, {}
+    if mask2 is not None:
+        for sw in slide_windows:
+            inner[sw] = valid_window_mask(mask2, sw)[..., pad:pad + h, pad:pad + w]
+            at[sw] = np.nonzero(inner[sw])
+        slide_windows_valid = [sw for sw in slide_windows if len(at[sw][0])]
+    else:
+        slide_windows_valid = slide_windows
+
+    # 内存占用只与图像大小和特征个数有关，与nbit无关
+    results = {sw: {f: np.zeros((len(step), len(angle)) + img2.shape[:-2] + (h, w), dtype=np.float32)
+                    for f in features}
+               for sw in slide_windows}
+    groups = _offset_groups(step, angle)
+    for (dr, dc), pos in groups:
+        s, t = pos[0]
+        windows = [sw for sw in slide_windows_valid
+                   if sw - abs(dr) > 0 and sw - abs(dc) > 0]
+        if not windows:
+            continue
+        boxes = [(pad - floor(sw/2), pad - floor(sw/2), sw - abs(dr), sw - abs(dc))
+                 for sw in windows]
+        codes = _pair_codes(img2, nbit, (dr, dc))
+        feature_maps = _direct_features(codes, nbit, boxes, h, w, features, method,
+                                        [at[sw] for sw in windows] if at else None)
+        for sw, maps in zip(windows, feature_maps):
+            for feature in features:
+                if at:
+                    results[sw][feature][s, t][at[sw]] = maps[feature]
+                else:
+                    results[sw][feature][s, t] = maps[feature]
+    # 取整后相同的偏移量只计算了一次
+    _copy_offset_groups(groups, *[(values, 0) for maps in results.values() for values in maps.values()])
+
+    for sw in inner:
+        for feature in features:
+            results[sw][feature][:, :, ~inner[sw]] = np.nan
+    return results
+
+
+def calcu_glcm_direct(img, mi, ma, nbit, slide_window, step, angle, features=GLCM_FEATURES, method='auto'):
+    '''
+    calc glcm features of every window straight from pixel pair codes,
+    the (nbit, nbit, ...) glcm is never built
+    method: 'integral', 'rolling' or 'auto', see _direct_features
+    returns {feature: array of shape (len(step), len(angle), h, w)}
+    '''
+    return calcu_glcm_direct_multiwindow(img, mi, ma, nbit, [slide_window], step, angle,
+                                         features, method)[slide_window]
+
+
+def calcu_glcm_direct_batch(imgs, mi, ma, nbit, slide_windows, step, angle, features=GLCM_FEATURES,
+                            method='auto', masks=None):
+    '''
+    calcu_glcm_direct_multiwindow of a batch (n, h, w) of equal-size images in one pass:
+    each image is padded like BORDER_REPLICATE of itself, and pair codes, integral images
+    and rolling histograms run over the whole batch at once
+    masks: optional (n, h, w) validity masks, windows not wholly inside them are NaN
+    returns {slide_window: {feature: array of shape (n, len(step), len(angle), h, w)}}
+    '''
+    for feature in features:
+        if feature not in GLCM_FEATURES:
+            raise ValueError(f"未知的纹理特征: {feature}")
+    if imgs.ndim != 3:
+        raise ValueError("批量图像应为(n, h, w)数组")
+    if masks is not None and masks.shape != imgs.shape:
+        raise ValueError("掩膜与图像尺寸不一致")
+
+    h, w = imgs.shape[1:]
+    pad = floor(max(slide_windows)/2)
+    border = ((0, 0), (pad, pad), (pad, pad))
+    img2 = np.pad(_quantize(imgs, mi, ma, nbit), border, mode='edge')
+    # 掩膜与图像一样复制边界，与单幅计算时相同
+    mask2 = None if masks is None else np.pad(masks.astype(bool), border, mode='edge')
+    window_maps = _direct_multiwindow_padded(img2, pad, nbit, slide_windows, step, angle, features, method,
+                                             h, w, mask2)
+    return {sw: {f: np.moveaxis(values, 2, 0) for f, values in maps.items()}
+            for sw, maps in window_maps.items()}
+
+
+def build_pyramid(img, factors, mask=None):
+    '''
+    gaussian pyramid levels of an image, each 2x level from the previous one (cv2.pyrDown),
+    all levels built in one pass; factors: downsampling factors (powers of 2) to return
+    mask: optional validity mask, a coarse pixel is valid only if its whole kernel support is valid
+    returns {factor: (img, mask)}
+    '''
+    for factor in factors:
+        if factor < 2 or factor & (factor - 1):
+            raise ValueError(f"金字塔降采样倍数应为2的幂: {factor}")
+    levels = {}
+    factor = 1
+    while factor < max(factors):
+        img = cv2.pyrDown(img)
+        if mask is not None:
+            # 5x5高斯核覆盖的像素全部有效时结果为1
+            mask = cv2.pyrDown(mask.astype(np.float32)) > 1 - 1e-6
+        factor *= 2
+        if factor in factors:
+            levels[factor] = (img, mask)
+    return levels
+
+
+def pyramid_window(slide_window, factor):
+    '''
+    odd window size at a pyramid level covering about the same ground as
+    slide_window at full resolution, at least 3
+    '''
+    return max(3, 2 * int(round((slide_window / factor - 1) / 2)) + 1)
+
+
+def _read_tile_padded(img, top, left, th, tw, pad):
+    '''
+    img[top-pad:top+th+pad, left-pad:left+tw+pad] of a (possibly memory-mapped) image,
+    parts outside the image filled like BORDER_REPLICATE of the whole image
+    '''
+    H, W = img.shape
+    y0, y1 = max(0, top - pad), min(H, top + th + pad)
+    x0, x1 = max(0, left - pad), min(W, left + tw + pad)
+    tile = np.ascontiguousarray(img[y0:y1, x0:x1])
+    if tile.dtype == bool:
+        tile = tile.astype(np.uint8)
+    # 只在整幅图像的真实边界处扩充，块之间的重叠区域直接读取相邻像素
+    return cv2.copyMakeBorder(tile, y0 - (top - pad), (top + th + pad) - y1,
+                              x0 - (left - pad), (left + tw + pad) - x1, cv2.BORDER_REPLICATE)
+
+
+def _tile_grid(shape, tile_size):
+    '''
+    (top, left, th, tw) of every tile, tile_size an int or (rows, cols)
+    '''
+    H, W = shape
+    rows, cols = tile_size if isinstance(tile_size, tuple) else (tile_size, tile_size)
+    for top in range(0, H, rows):
+        for left in range(0, W, cols):
+            yield top, left, min(rows, H - top), min(cols, W - left)
+
+
+def row_bands(shape, workers, slide_window):
+    '''
+    tile size (rows, W) splitting an image into horizontal row bands for workers processes
+    '''
+    H, W = shape
+    # 每个进程约2个行带便于负载均衡；行带高度不低于窗口的4倍，重叠边的重复计算不超过一半
+    rows = max(ceil(H / (2 * workers)), 4 * slide_window)
+    return (min(rows, H), W)
+
+
+def _glcm_tile(img, mi, ma, nbit, slide_window, step, angle, features, mode, method, mask,
+               top, left, th, tw):
+    '''
+    glcm features of the tile img[top:top+th, left:left+tw], see iter_glcm_tiles
+    '''
+    pad = floor(slide_window/2)
+    # 先读取带重叠边的块再量化，与整幅图像量化后扩充的结果相同
+    mask2 = None
+    if mask is not None:
+        mask2 = _read_tile_padded(mask, top, left, th, tw, pad)
+        inner = valid_window_mask(mask2, slide_window)[pad:pad + th, pad:pad + tw]
+        if not inner.any():
+            # 整块都在背景中，不读取影像也不计算
+            return {f: np.full((len(step), len(angle), th, tw), np.nan, dtype=np.float32) for f in features}
+    tile = _read_tile_padded(img, top, left, th, tw, pad)
+    return _glcm_tile_features(tile, mask2, mi, ma, nbit, slide_window, step, angle, features, mode, method)
+
+
+def _glcm_tile_features(tile, mask2, mi, ma, nbit, slide_window, step, angle, features, mode, method,
+                        average=False):
+    '''
+    glcm features of a tile read with a halo of slide_window//2, mask2 its mask read the same way;
+    average: see calcu_glcm_tiled, applied here so that worker processes return smaller maps
+    '''
+    pad = floor(slide_window/2)
+    th, tw = tile.shape[0] - 2 * pad, tile.shape[1] - 2 * pad
+    img2 = _quantize(tile, mi, ma, nbit)
+    if mode == 'direct':
+        feature_maps = _direct_multiwindow_padded(img2, pad, nbit, [slide_window], step, angle,
+                                                  features, method, th, tw, mask2)[slide_window]
+        return _average_maps(feature_maps, average)
+    # 与整幅图像的dense计算相同：小窗口用稀疏的像素对编码列表，大窗口用上三角整数计数
+    if slide_window <= SPARSE_MAX_WINDOW:
+        glcm = _calcu_glcm_sparse_padded(img2, nbit, slide_window, step, angle, th, tw)
+    else:
+        glcm = _calcu_glcm_padded(img2, nbit, slide_window, step, angle, th, tw,
+                                  packed=True, normed=False)
+    feature_maps = calcu_glcm_features(glcm, nbit, features)
+    del glcm
+    if mask2 is not None:
+        inner = valid_window_mask(mask2, slide_window)[pad:pad + th, pad:pad + tw]
+        for values in feature_maps.values():
+            values[:, :, ~inner] = np.nan
+    return _average_maps(feature_maps, average)
+
+
+def _average_maps(feature_maps, average):
+    '''
+    feature maps (len(step), len(angle), h, w) averaged as calcu_glcm_tiled's average
+    '''
+    if average == 'angle':
+        return {f: np.mean(values, axis=1) for f, values in feature_maps.items()}
+    if average:
+        return {f: np.mean(values, axis=(0, 1)) for f, values in feature_maps.items()}
+    return feature_maps
+
+
+def iter_glcm_tiles(img, mi, ma, nbit, slide_window, step, angle, features=GLCM_FEATURES,
+                    tile_size=512, mode='direct', method='auto', mask=None):
+    '''
+    calc glcm features tile by tile, each tile read with a halo of slide_window//2
+    img: 2-D array, np.memmap or anything sliced like one
+    tile_size: int, or (rows, cols) e.g. row_bands()
+    mode: 'direct' (calcu_glcm_direct) or 'dense' (calcu_glcm + calcu_glcm_features)
+    mask: optional validity mask shaped like img, see calcu_glcm_direct_multiwindow;
+          tiles without any valid window are skipped
+    yields (top, left, {feature: array of shape (len(step), len(angle), th, tw)})
+    '''
+    for feature in features:
+        if feature not in GLCM_FEATURES:
+            raise ValueError(f"未知的纹理特征: {feature}")
+    if mode not in ('direct', 'dense'):
+        raise ValueError(f"未知的GLCM计算方式: {mode}")
+
+    for top, left, th, tw in _tile_grid(img.shape, tile_size):
+        yield top, left, _glcm_tile(img, mi, ma, nbit, slide_window, step, angle, features, mode, method,
+                                    mask, top, left, th, tw)
+
+
+def calcu_glcm_tiled(img, mi, ma, nbit, slide_window, step, angle, features=GLCM_FEATURES,
+                     tile_size=512, mode='direct', method='auto', out=None, average=False, mask=None,
+                     workers=1):
+    '''
+    calc glcm features of a large image in tiles, stitched into one array per feature;
+    peak memory depends on tile_size, not on the image size
+    out: optional {feature: array} to write into, e.g. np.memmap when the results
+         do not fit in memory either
+    average: keep only the mean over step and angle of each tile,
+             'angle': the mean over angle of each step
+    mask: optional validity mask, see iter_glcm_tiles
+    workers: processes computing tiles at the same time, e.g. with tile_size=row_bands(...)
+             to use several cores on one image, or a ProcessPoolExecutor to reuse for
+             several calls; peak memory grows with the number of processes
+    returns {feature: array of shape (len(step), len(angle), H, W)}, (H, W) if average,
+            (len(step), H, W) if average='angle'
+    '''
+    H, W = img.shape
+    if out is None:
+        if average == 'angle':
+            shape = (len(step), H, W)
+        else:
+            shape = (H, W) if average else (len(step), len(angle), H, W)
+        out = {f: np.zeros(shape, dtype=np.float32) for f in features}
+
+    def store(top, left, feature_maps):
+        for feature, values in feature_maps.items():
+            th, tw = values.shape[-2:]
+            out[feature][..., top:top + th, left:left + tw] = values
+
+    if not isinstance(workers, Executor) and workers <= 1:
+        for top, left, feature_maps in iter_glcm_tiles(img, mi, ma, nbit, slide_window, step, angle,
+                                                       features, tile_size, mode, method, mask):
+            store(top, left, _average_maps(feature_maps, average))
+        return out
+
+    for feature in features:
+        if feature not in GLCM_FEATURES:
+            raise ValueError(f"未知的纹理特征: {feature}")
+    if mode not in ('direct', 'dense'):
+        raise ValueError(f"未知的GLCM计算方式: {mode}")
+
+    # 各块（行带）在子进程中计算：纯Python的逐列循环等持有GIL的部分不会限制多核的扩展；
+    # 本进程读取带重叠边的块发给子进程，结果按块写入，各块互不重叠
+    pool = workers if isinstance(workers, Executor) else ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        pad = floor(slide_window/2)
+        futures = {}
+        for top, left, th, tw in _tile_grid(img.shape, tile_size):
+            mask2 = None
+            if mask is not None:
+                mask2 = _read_tile_padded(mask, top, left, th, tw, pad)
+                if not valid_window_mask(mask2, slide_window)[pad:pad + th, pad:pad + tw].any():
+                    # 整块都在背景中，不读取影像也不计算
+                    store(top, left, _average_maps(
+                        {f: np.full((len(step), len(angle), th, tw), np.nan, dtype=np.float32)
+                         for f in features}, average))
+                    continue
+            tile = _read_tile_padded(img, top, left, th, tw, pad)
+            future = pool.submit(_glcm_tile_features, tile, mask2, mi, ma, nbit, slide_window,
+                                 step, angle, features, mode, method, average)
+            futures[future] = (top, left)
+        # 完成一块写入一块，不保留已完成块的结果
+        for future in as_completed(futures):
+            store(*futures[future], future.result())
+    finally:
+        if pool is not workers:
+            pool.shutdown()
+    return out
+
+
+def estimate_glcm_memory(shape, nbit, slide_windows, step, angle, features=GLCM_FEATURES,
+                         mode='dense', tile_size=None, average=False):
+    '''
+    predicted peak bytes of one glcm job on an image of the given shape
+    mode: 'dense' (calcu_glcm_packed counts + calcu_glcm_features, one window after another,
+          calcu_glcm_sparse for windows up to SPARSE_MAX_WINDOW),
+          'direct' (calcu_glcm_direct_multiwindow, all windows at once);
+          with tile_size (int or (rows, cols)) the job runs through calcu_glcm_tiled,
+          one window after another
+    average: the tiled results are kept as the mean over step and angle,
+             'angle': as the mean over angle of each step
+    '''
+    H, W = shape
+    n_offsets = len(step) * len(angle)
+    n_features = len(features)
+    # 所有窗口的特征结果（float32）一直保留到任务结束
+    output = 4 * n_features * H * W * len(slide_windows)
+    if not (average and tile_size):
+        output *= n_offsets
+    elif average == 'angle':
+        output *= len(step)
+    if tile_size is None:
+        h, w = H, W
+    else:
+        rows, cols = tile_size if isinstance(tile_size, tuple) else (tile_size, tile_size)
+        h, w = min(rows, H), min(cols, W)
+
+    def dense(sw):
+        padded = (h + sw) * (w + sw)
+        if sw <= SPARSE_MAX_WINDOW:
+            # 稀疏共生矩阵：每个窗口sw*sw个编码和计数（uint16），排序临时数组按64行分块
+            K = sw * sw
+            return 4 * n_offsets * h * w * K + 4 * padded + 40 * 64 * w * K + 10 * 8 * (1 << 20)
+        # 对称共生矩阵只保存上三角的整数计数（calcu_glcm_packed normed=False）
+        itemsize = np.dtype(_count_dtype(2 * sw * sw)).itemsize
+        glcm = itemsize * (nbit * (nbit + 1) // 2) * n_offsets * h * w
+        # 像素对编码及其上三角索引（intp）、unique排序副本、散列索引临时数组
+        codes = 24 * padded + 24 * h * w
+        # 特征按块计算，每块约(1<<22)个单元，对数、边缘分布等临时数组
+        chunk = 4 * (1 << 22) * 4 + 24 * nbit * ((1 << 22) // (nbit * nbit)) * 8
+        return glcm + codes + chunk
+
+    def direct(windows):
+        pad = floor(max(windows) / 2)
+        padded = (h + 2 * pad) * (w + 2 * pad)
+        n = len(windows)
+        # 编码、高低灰度级（int64）、权重和积分图临时数组
+        codes = 64 * padded
+        # 每个窗口尺寸的窗口和、float64特征结果、熵/二阶矩计数及其临时数组
+        sums = (80 + 8 * n_features) * h * w * n
+        # 滑动直方图，每个窗口尺寸的每一行（较短的一边）一个nbit*nbit直方图
+        hist = 2 * n * min(h, w) * nbit * nbit
+        return codes + sums + hist
+
+    if tile_size is None and mode == 'direct':
+        work = direct(slide_windows)
+    elif mode == 'direct':
+        work = max(direct([sw]) for sw in slide_windows)
+    else:
+        work = max(dense(sw) for sw in slide_windows)
+    return output + work
+
+
+def available_memory():
+    '''
+    available physical memory in bytes, None if unknown
+    '''
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if os.name == 'nt':
+        import ctypes
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                        ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                        ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                        ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                        ("sullAvailExtendedVirtual", ctypes.c_ulonglong)]
+
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+    return None
+
+
+# 按行带计算的子进程在计算之外的固定内存（导入的模块等），约为实测的最大常驻内存
+WORKER_PROCESS_MEMORY = 100 << 20
+
+
+def plan_glcm_job(shape, nbit, slide_windows, step, angle, features=GLCM_FEATURES,
+                  mode='dense', workers=1, budget=None, average=False):
+    '''
+    admission control of a glcm job: keep the requested mode if its peak fits in the
+    memory budget, otherwise fall back to fewer workers, feature-direct mode, then tiles
+    budget: bytes for all workers together, default 70% of available_memory()
+    average: see estimate_glcm_memory
+    returns {'mode', 'tile_size', 'workers', 'estimate', 'budget'}
+    '''
+    if budget is None:
+        available = available_memory()
+        budget = None if available is None else int(0.7 * available)
+
+    candidates = [(mode, None)]
+    if mode == 'dense':
+        candidates.append(('direct', None))
+    candidates += [('direct', tile_size) for tile_size in (2048, 1024, 512, 256, 128)
+                   if tile_size < max(shape)]
+
+    plan = None
+    for job_mode, tile_size in candidates:
+        estimate = estimate_glcm_memory(shape, nbit, slide_windows, step, angle, features,
+                                        job_mode, tile_size, average)
+        plan = {'mode': job_mode, 'tile_size': tile_size, 'workers': workers,
+                'estimate': estimate, 'budget': budget}
+        if budget is None:
+            break
+        # 内存不足时先减少并行进程数，仍不足再换用更省内存的计算方式；
+        # 按行带多进程计算时每个子进程另有导入numpy、OpenCV等的固定内存
+        per_worker = estimate + (WORKER_PROCESS_MEMORY if workers > 1 else 0)
+        fit = int(budget // max(per_worker, 1))
+        if fit >= 1:
+            plan['workers'] = min(workers, fit)
+            break
+    # 所有方式都超出预算时返回最省内存的方案，单进程运行
+    if budget is not None and plan['estimate'] > budget:
+        plan['workers'] = 1
+    return plan
+
+
 def calcu_glcm_mean(glcm, nbit):
     '''
     calc glcm mean
     '''
-    # glcm对应的是灰度共生矩阵中的一个值  因此让它等于0是错的，应该是原始像素值等于0
-    mean = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    for i in range(nbit):
-        for j in range(nbit):    
-            mean += glcm[i,j] * i 
-    return mean 
+    return calcu_glcm_features(glcm, nbit, ["MEA"])["MEA"]
 
 def calcu_glcm_variance(glcm, nbit):
     '''
     calc glcm variance
     '''
-    mean = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    for i in range(nbit):
-        for j in range(nbit):
-            # mean += glcm[i, j] * i / (nbit)**2
-            mean += glcm[i, j] * i 
-
-    variance = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    for i in range(nbit):  
-        for j in range(nbit):
-            variance += glcm[i, j] * (i - mean)**2
-
-    return variance 
+    return calcu_glcm_features(glcm, nbit, ["VAR"])["VAR"]
 
 def calcu_glcm_homogeneity(glcm, nbit):
     '''
     calc glcm Homogeneity
     '''
-    Homogeneity = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    for i in range(nbit):
-        for j in range(nbit):
-            Homogeneity += glcm[i,j] / (1.+(i-j)**2)
-
-    return Homogeneity
+    return calcu_glcm_features(glcm, nbit, ["HOM"])["HOM"]
 
 def calcu_glcm_contrast(glcm, nbit):
     '''
     calc glcm contrast
     '''
-    contrast = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    for i in range(nbit):
-        for j in range(nbit):
-            contrast += glcm[i, j] * ((i-j)**2)
-
-    return contrast
+    return calcu_glcm_features(glcm, nbit, ["CON"])["CON"]
 
 def calcu_glcm_dissimilarity(glcm, nbit):
     '''
     calc glcm dissimilarity
     '''
-    dissimilarity = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    for i in range(nbit):
-        for j in range(nbit):
-            dissimilarity += glcm[i, j] * np.abs(i-j)
-
-    return dissimilarity
+    return calcu_glcm_features(glcm, nbit, ["DIS"])["DIS"]
 
 def calcu_glcm_entropy(glcm, nbit):
     '''
     calc glcm entropy 
     '''
-    eps = 0.00001 
-    # 因为背景为0值，而glcm不能为0，因此设定eps为0.00001值
-    # a=np.zeros((64,64))
-    entropy = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    glcm_log = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    
-    
-    for i in range(nbit):
-        for j in range(nbit):
-            
-            glcm[i, j][glcm[i, j]==0] = 0.00001
-            
-            glcm_log = copy.deepcopy(glcm[i, j])
-            
-            glcm[i, j][glcm[i, j]==0.00001] = 0 
-            
-            entropy += -glcm[i, j] * np.log(glcm_log)
-
-    return entropy
+    return calcu_glcm_features(glcm, nbit, ["ENT"])["ENT"]
 
 
 def calcu_glcm_correlation(glcm, nbit):
@@ -157,38 +1404,7 @@ def calcu_glcm_correlation(glcm, nbit):
     '''
     calc glcm correlation (Unverified result)
     '''
-    eps = 0.00001 
-    mean_x = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    for i in range(nbit):
-        for j in range(nbit):
-            mean_x += glcm[i, j] * i 
-            
-    mean_y = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    for i in range(nbit):
-        for j in range(nbit):
-            mean_y += glcm[i, j] * j
-    
-    variance_x = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    for i in range(nbit):
-        for j in range(nbit):
-            variance_x += glcm[i, j] * (i - mean_x)**2
-            
-    variance_y = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    for i in range(nbit):
-        for j in range(nbit):
-            variance_y += glcm[i, j] * (j - mean_y)**2
-    
-    
-    ppo = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    for i in range(nbit):
-        for j in range(nbit):
-            ppo += glcm[i, j]*i*j 
-            
-    correlation = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    correlation = (ppo-(mean_x*mean_y))/((np.sqrt(variance_x)*np.sqrt(variance_y))+eps)
-            
-
-    return correlation
+    return calcu_glcm_features(glcm, nbit, ["COR"])["COR"]
 
  
 def calcu_glcm_Second_Moment(glcm, nbit):
@@ -197,13 +1413,7 @@ def calcu_glcm_Second_Moment(glcm, nbit):
     calc glcm Second_Moment
     
     '''
-    Second_Moment = np.zeros((glcm.shape[2], glcm.shape[3]), dtype=np.float32)
-    for i in range(nbit):
-        for j in range(nbit):
-            Second_Moment += glcm[i, j]**2
-            # Second_Moment += glcm[i, j]
-
-    return Second_Moment
+    return calcu_glcm_features(glcm, nbit, ["SEM"])["SEM"]
 
 
 
@@ -223,129 +1433,75 @@ def calcu_txt_mean(txt_img,t):
     return txt_mean
  
     
-def Edge_Remove(data,value):
-    
-    # 矩阵转数组
-    data = np.array(data)
-    
-    # 矩阵左右边界增加0行
-    h=np.full((data.shape[0],1),0)
-    data=np.column_stack((h,data))
-    data=np.column_stack((data,h))
-    
-    
-    # 增加首尾0行
-    t=np.full((1, data.shape[1]),value)
-    data=np.row_stack((data,t))
-    data=np.row_stack((t,data))
-    
-    
-    
-    row_2=data.shape[0]
-    column_2=data.shape[1]
-    
-    # 转换为一行
-    data=data.reshape(1,-1)
+def erode_mask(mask, margin, axis=None, border_valid=False):
+    '''
+    binary erosion: True where every pixel within margin is True
+    axis: None erodes with a (2*margin+1)^2 square, an int along that axis only
+    border_valid: pixels outside the array count as True (like BORDER_REPLICATE)
+    '''
+    mask = np.asarray(mask, dtype=bool)
+    if margin <= 0:
+        return mask.copy()
+    if axis is None:
+        if mask.ndim > 2:
+            return np.stack([erode_mask(m, margin, None, border_valid) for m in mask])
+        kernel = np.ones((2 * margin + 1, 2 * margin + 1), dtype=np.uint8)
+        if border_valid:
+            # 腐蚀的默认边界值不会腐蚀图像边缘
+            return cv2.erode(mask.astype(np.uint8), kernel) > 0
+        return cv2.erode(mask.astype(np.uint8), kernel, borderType=cv2.BORDER_CONSTANT, borderValue=0) > 0
 
+    # 沿一个轴：窗口内无效像素个数由累加和相减得到
+    mask = np.moveaxis(mask, axis, -1)
+    n = mask.shape[-1]
+    invalid = np.zeros(mask.shape[:-1] + (n + 1,), dtype=np.int64)
+    np.cumsum(~mask, axis=-1, out=invalid[..., 1:])
+    index = np.arange(n)
+    count = (invalid[..., np.minimum(index + margin + 1, n)]
+             - invalid[..., np.maximum(index - margin, 0)])
+    eroded = mask & (count == 0)
+    if not border_valid:
+        eroded &= (index >= margin) & (index < n - margin)
+    return np.moveaxis(eroded, -1, axis)
+
+
+def _remove_run_edges(flat, value, margin):
+    '''
+    set the first and last margin pixels of every run of non-value pixels to value, in place
+    '''
+    valid = flat != value
+    keep = erode_mask(valid, margin, axis=0, border_valid=True)
+    # 与原逐点实现保持一致：段末位置小于margin时，负索引回绕改写到数组末尾
+    ends = np.flatnonzero(valid[:-1] & ~valid[1:])
+    for end in ends[ends < margin - 1]:
+        flat[end - margin + 1:] = value
+    flat[valid & ~keep] = value
 
-    list1=[]
-    list2=[]
-    
-    # loop序号
-    loop_n1=data.size-1
-    # 横向边界值去除numpy: np.logical_and/or/not (逻辑与/或/非)
-    for i in range(loop_n1):
-        if  np.logical_and(data[0,i]== value , data[0,i+1] != value):
-            list1.append(i)
-
-
-    for i in range(loop_n1):
-        if  np.logical_and(data[0,i] != value , data[0,i+1] == value):
-            list2.append(i)
-
-
-    for t in range(len(list1)):
-        data[0,list1[t]+1]=value
-        data[0,list1[t]+2]=value
-        data[0,list1[t]+3]=value
-        data[0,list1[t]+4]=value
-        data[0,list1[t]+5]=value
-        data[0,list1[t]+6]=value
-        data[0,list1[t]+7]=value
-        data[0,list1[t]+8]=value
-        data[0,list1[t]+9]=value
-        data[0,list1[t]+10]=value
-        data[0,list1[t]+11]=value
-
-
-    for t in range(len(list2)):
-        data[0,list2[t]]=value
-        data[0,list2[t]-1]=value
-        data[0,list2[t]-2]=value
-        data[0,list2[t]-3]=value
-        data[0,list2[t]-4]=value
-        data[0,list2[t]-5]=value
-        data[0,list2[t]-6]=value
-        data[0,list2[t]-7]=value
-        data[0,list2[t]-8]=value
-        data[0,list2[t]-9]=value
-        data[0,list2[t]-10]=value
-
-    # 转换为原来的尺寸
-    data=data.reshape(row_2,column_2)
-    
-    # 转置
-    data=data.T
-    
-    # 准换为一行
-    data=data.reshape(1,-1)
 
-    list3=[]
-    list4=[]
-     
-    # loop序号
-    loop_n2=data.size-1
-    for i in range(loop_n2):
-        if  np.logical_and(data[0,i]== value , data[0,i+1] != value):
-        # if data[i] == value  and  data[i+1] != value:
-            list3.append(i)
+def Edge_Remove(data, value, margin=11):
+    '''
+    set the first and last margin pixels of every run of non-value pixels to value,
+    along rows of the padded array and then along its columns
+    returns the array padded with a column of 0 and a row of value on each side
+    '''
+    # 矩阵转数组
+    data = np.array(data)
 
-    for i in range(loop_n2):
-        if  np.logical_and(data[0,i] != value , data[0,i+1] == value):
-            list4.append(i)
+    # 矩阵左右边界增加0行，首尾增加value行
+    h = np.full((data.shape[0], 1), 0)
+    data = np.column_stack((h, data, h))
+    t = np.full((1, data.shape[1]), value)
+    data = np.vstack((t, data, t))
 
+    # 按行展开后去除每段非value像素首尾各margin个像素（跨行相连的像素视为同一段），
+    # 等价于对非value像素做半径为margin的一维腐蚀
+    _remove_run_edges(data.reshape(-1), value, margin)
 
-    for t in range(len(list3)):
-        
-        data[0,list3[t]+1]=value
-        data[0,list3[t]+2]=value
-        data[0,list3[t]+3]=value
-        data[0,list3[t]+4]=value
-        data[0,list3[t]+5]=value
-        data[0,list3[t]+6]=value
-        data[0,list3[t]+7]=value
-        data[0,list3[t]+8]=value
-        data[0,list3[t]+9]=value
-        data[0,list3[t]+10]=value
-        data[0,list3[t]+11]=value
-
-    for t in range(len(list4)):
-        
-        data[0,list4[t]]=value
-        data[0,list4[t]-1]=value
-        data[0,list4[t]-2]=value
-        data[0,list4[t]-3]=value
-        data[0,list4[t]-4]=value
-        data[0,list4[t]-5]=value
-        data[0,list4[t]-6]=value
-        data[0,list4[t]-7]=value
-        data[0,list4[t]-8]=value
-        data[0,list4[t]-9]=value
-        data[0,list4[t]-10]=value
-        
-    data_final=data.reshape(column_2,row_2).T
-    
-    return data_final
+    # 再按列展开做同样处理
+    data_t = np.ascontiguousarray(data.T)
+    _remove_run_edges(data_t.reshape(-1), value, margin)
+
+    return data_t.T
 
 
 if __name__ == '__main__':
@@ -1,8 +1,11 @@
 import sys
+import multiprocessing
 from PyQt5.QtWidgets import QApplication
 from main_window import MainWindow
 
 if __name__ == "__main__":
+    # 纹理计算使用多进程，打包为exe后子进程需要freeze_support
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -1,81 +1,1172 @@
 # texture_index_tab.py
 import os
+import datetime
+import json
+import time
+import importlib.util
+import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 import skimage.io
 import cv2
 import pandas as pd
+import geopandas as gpd
+import rasterio
+from rasterio.enums import MaskFlags
+from rasterio.mask import raster_geometry_mask
+from rasterio.windows import Window
+from shapely.geometry import mapping
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QGridLayout, QHBoxLayout, 
     QLabel, QLineEdit, QPushButton, QCheckBox,
     QScrollArea, QMessageBox, QFileDialog,
-    QGroupBox, QApplication
+    QGroupBox, QApplication, QComboBox, QSpinBox
 )
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from get_glcm import (
-    calcu_glcm, calcu_glcm_mean, calcu_glcm_variance,
-    calcu_glcm_homogeneity, calcu_glcm_contrast,
-    calcu_glcm_dissimilarity, calcu_glcm_entropy,
-    calcu_glcm_correlation, calcu_glcm_Second_Moment,
+    calcu_glcm_packed, calcu_glcm_sparse, calcu_glcm_features, calcu_glcm_direct_multiwindow, calcu_glcm_tiled,
+    calcu_glcm_plot, calcu_glcm_direct_batch, iter_glcm_tiles,
+    SPARSE_MAX_WINDOW, GLCM_FEATURES,
+    row_bands, plan_glcm_job, available_memory, mask_bbox, valid_window_mask, build_pyramid, pyramid_window,
     Edge_Remove, calcu_txt_mean
 )
 
+def _guess_band_name(img_path):
+    # 由文件路径判断波段（文件夹或文件名如 Red, Green, Blue）
+    # 'RedEdge'包含'Red'，需要先判断
+    if 'RedEdge' in img_path:
+        return 'RE'
+    elif 'Red' in img_path:
+        return 'R'
+    elif 'Green' in img_path:
+        return 'G'
+    elif 'Blue' in img_path:
+        return 'B'
+    elif 'NIR' in img_path:
+        return 'NIR'
+    return 'Unknown'
+
+
+# 纹理图GeoTIFF的计算块大小，为输出分块（256）的整数倍，每块写入时正好对齐
+MAP_TILE_SIZE = 512
+
+# 批量计算：每个任务的图像（地块）数；尺寸向上取整到该倍数后分组；
+# 一批纹理图的float32数值个数上限（约64MB），超过时分成几批
+BATCH_SOURCES = 128
+BATCH_SHAPE_STEP = 16
+BATCH_MAX_VALUES = 1 << 24
+
+# 金字塔模式的降采样倍数，速度/精度对比报告中逐个比较
+PYRAMID_LEVELS = (2, 4, 8)
+# 速度/精度对比只在掩膜中心（无掩膜时为图像中心）裁剪的样本上计算，样本边长上限
+PYRAMID_SAMPLE_SIZE = 1024
+
+
+# 正射影像中的一个地块：计算时按多边形范围直接读取窗口，不需要先裁剪保存为单独的影像
+# geometries为影像坐标系下的GeoJSON几何，可以传给子进程
+class PlotChip:
+    def __init__(self, ortho_path, name, geometries):
+        self.ortho_path = ortho_path
+        self.name = name
+        self.geometries = geometries
+
+    def __eq__(self, other):
+        return isinstance(other, PlotChip) and (self.ortho_path, self.name) == (other.ortho_path, other.name)
+
+    def __hash__(self):
+        return hash((self.ortho_path, self.name))
+
+
+def _open_raster(path, mode='r', **profile):
+    # 打开影像（或创建GeoTIFF），预处理输出的地块影像、PNG等没有地理参考，忽略相应的警告
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", rasterio.errors.NotGeoreferencedWarning)
+        return rasterio.open(path, mode, **profile)
+
+
+def _load_plot_chips(ortho_path, shp_path, field='name'):
+    # 与预处理相同：按字段值分组（同名的多个多边形为一个地块），矢量坐标系不同时转换到影像坐标系
+    gdf = gpd.read_file(shp_path)
+    if field not in gdf.columns:
+        raise ValueError(f"矢量文件中没有字段: {field}")
+    with _open_raster(ortho_path) as src:
+        crs = src.crs
+    if gdf.crs is not None and crs is not None and str(gdf.crs) != str(crs):
+        gdf = gdf.to_crs(crs.to_wkt())
+    chips = []
+    for name_value, group in gdf.groupby(field):
+        geometries = [mapping(geom) for geom in group.geometry if geom is not None and not geom.is_empty]
+        if geometries:
+            chips.append(PlotChip(ortho_path, str(name_value), geometries))
+    return chips
+
+
+def _source_name(source):
+    # 结果表中的文件名：影像文件为文件名，正射影像中的地块为地块名称
+    return source.name if isinstance(source, PlotChip) else os.path.basename(source)
+
+
+# 纹理计算参数和单幅图像的处理，不依赖Qt，可以传给子进程
+class TextureTask:
+    def __init__(self, features, glcm_mode='dense', use_mask=False, steps=(1,), memory_budget=None,
+                 threads=1, band_map=None, map_dir=None, pyramid=1):
+        self.features = features
+        # 'dense': 先计算完整共生矩阵再提取特征；'direct': 由像素对直接累加特征，不生成共生矩阵
+        self.glcm_mode = glcm_mode
+        # 只计算完全位于地块掩膜（nodata以外）内的窗口，背景像素不参与计算
+        self.use_mask = use_mask
+        # GLCM像素对距离，距离不是只有默认的1时每个距离单独输出一列（如 R_HOM_d2）
+        self.steps = sorted(set(steps))
+        # 内存预检使用的预算（字节），None时为可用内存的70%；多进程时各进程平分
+        self.memory_budget = memory_budget
+        # 单幅图像内按行带并行计算的进程数
+        self.threads = threads
+        # 多波段影像的波段名称（按波段顺序，'-'跳过该波段，空列表时使用影像的波段描述）；None为单波段文件
+        self.band_map = band_map
+        # 逐像素纹理图的输出文件夹，None时只输出每幅图像的特征均值
+        self.map_dir = map_dir
+        # 金字塔降采样倍数（1、2、4、8）：滑动窗口纹理在降采样后的影像上用等效的较小窗口计算，1为原始分辨率
+        self.pyramid = pyramid
+        # 运行报告：每幅图像的内存预估和实际采用的计算方式
+        self.report = []
+
+    def process_image(self, img_path, window_size):
+        return self.process_image_windows(img_path, [window_size])[window_size]
+
+    def _read_normalized(self, img_path):
+        # 增强图像读取：单波段GeoTIFF用rasterio按原始数据类型读取（如uint16），不转换为float64
+        try:
+            img = None
+            if img_path.lower().endswith(('.tif', '.tiff')):
+                img = self._read_band(img_path)
+            if img is None:
+                img = skimage.io.imread(img_path, as_gray=True)
+            if img is None or img.size == 0:
+                raise ValueError("无效的图像数据")
+        except Exception as e:
+            raise ValueError(f"图像读取失败: {str(e)}")
+        return img, self._normalize(img)
+
+    def _read_band(self, img_path):
+        # 单波段影像返回原始数据类型的数组；多波段（如RGB）返回None，仍由skimage转换为灰度
+        try:
+            src = _open_raster(img_path)
+        except rasterio.errors.RasterioError:
+            return None
+        with src:
+            if src.count != 1:
+                return None
+            return src.read(1)
+
+    def _band_names(self, src):
+        # 按波段对应关系得到波段名称（'-'为跳过的波段）和需要读取的波段序号
+        names = list(self.band_map) or [d or f"B{i}" for i, d in enumerate(src.descriptions, 1)]
+        if len(names) > src.count:
+            raise ValueError(f"波段对应关系包含{len(names)}个波段，影像只有{src.count}个波段")
+        indexes = [i + 1 for i, name in enumerate(names) if name != '-']
+        if not indexes:
+            raise ValueError("没有需要计算的波段")
+        return names, indexes
+
+    def _read_multiband(self, img_path):
+        # 多波段影像只打开和解码一次，返回{波段名称: 波段数据}和所有波段共用的有效像素掩膜
+        try:
+            with _open_raster(img_path) as src:
+                names, indexes = self._band_names(src)
+                data = src.read(indexes)
+                # 优先使用影像自带的nodata/掩膜（含alpha波段），否则以所有波段均为0的像素为背景
+                if any(MaskFlags.all_valid not in flags for flags in src.mask_flag_enums):
+                    mask = src.dataset_mask() > 0
+                else:
+                    mask = np.any(data != 0, axis=0)
+        except (rasterio.errors.RasterioError, ValueError) as e:
+            raise ValueError(f"图像读取失败: {str(e)}")
+        bands = {name: band for name, band in zip([n for n in names if n != '-'], data)}
+        return bands, mask
+
+    def process_multiband(self, img_path, window_sizes):
+        # 一个文件中的所有波段依次计算纹理，window_sizes为None时计算地块整体GLCM
+        # 返回{波段名称: 与单波段相同的结果}
+        bands, mask = self._read_multiband(img_path)
+        stem = os.path.splitext(os.path.basename(img_path))[0]
+        georef = self._read_georef(img_path) if self.map_dir is not None else None
+        return self._texture_bands(os.path.basename(img_path), stem, georef, bands, mask, window_sizes)
+
+    def process_plot_chip(self, chip, window_sizes):
+        # 正射影像中的一个地块：只读取多边形外接矩形的窗口，多边形作为有效像素掩膜
+        # 返回{波段名称: 结果}，单波段正射影像的波段名称由文件路径判断
+        bands, mask, georef = self._read_plot_chip(chip)
+        return self._texture_bands(chip.name, chip.name, georef, bands, mask, window_sizes)
+
+    def _texture_bands(self, label, stem, georef, bands, mask, window_sizes):
+        results = {}
+        for name, band in bands.items():
+            try:
+                img_norm = self._normalize(band)
+                band_label = f"{label} [{name}]"
+                if window_sizes is None:
+                    results[name] = self._texture_plot(img_norm, mask)
+                elif self.map_dir is not None:
+                    results[name] = self._texture_maps(band_label, stem, georef, name, img_norm,
+                                                       mask if self.use_mask else None, window_sizes)
+                else:
+                    results[name] = self._texture_windows(band_label, img_norm, mask if self.use_mask else None,
+                                                          window_sizes)
+            except Exception as e:
+                raise ValueError(f"波段[{name}]: {str(e)}")
+        return results
+
+    def _read_plot_chip(self, chip):
+        # 与预处理的裁剪结果一致：多边形外和nodata像素填0，再以所有波段均为0的像素为背景
+        try:
+            with _open_raster(chip.ortho_path) as src:
+                if self.band_map is None:
+                    if src.count != 1:
+                        raise ValueError("多波段正射影像需要勾选多波段影像并填写波段顺序")
+                    names, indexes = [_guess_band_name(chip.ortho_path)], [1]
+                else:
+                    names, indexes = self._band_names(src)
+                try:
+                    outside, transform, window = raster_geometry_mask(src, chip.geometries, crop=True)
+                except ValueError:
+                    raise ValueError("地块与影像没有重叠")
+                data = src.read(indexes, window=window, masked=True).filled(0)
+                crs = src.crs
+        except rasterio.errors.RasterioError as e:
+            raise ValueError(f"图像读取失败: {str(e)}")
+        data[:, outside] = 0
+        mask = np.any(data != 0, axis=0)
+        bands = {name: band for name, band in zip([n for n in names if n != '-'], data)}
+        return bands, mask, (crs, transform)
+
+    def process_image_maps(self, img_path, window_sizes):
+        img, img_norm = self._read_normalized(img_path)
+        mask = self._read_valid_mask(img_path, img) if self.use_mask else None
+        del img
+        band_name = _guess_band_name(img_path)
+        stem = os.path.splitext(os.path.basename(img_path))[0]
+        return self._texture_maps(f"{os.path.basename(img_path)} [{band_name}]", stem, self._read_georef(img_path),
+                                  band_name, img_norm, mask, window_sizes)
+
+    def _texture_maps(self, label, stem, georef, band_name, img_norm, mask, window_sizes):
+        # 逐像素纹理图：按块计算特征并立即写入分块压缩的GeoTIFF（每个特征和距离一个波段，方向取平均），
+        # 内存只与块大小有关；掩膜外（窗口包含背景）为NaN
+        # 返回{窗口尺寸: 纹理图文件路径}
+        self._level_params(window_sizes, 1)
+        features = [f for f in self.features if f in GLCM_FEATURES]
+        names = [self._feature_column(f, step) for f in features for step in self.steps]
+        crs, transform = georef
+        height, width = img_norm.shape
+        profile = {
+            'driver': 'GTiff', 'width': width, 'height': height, 'count': len(names),
+            'dtype': 'float32', 'nodata': np.nan, 'crs': crs, 'transform': transform,
+            'tiled': True, 'blockxsize': 256, 'blockysize': 256,
+            'compress': 'deflate', 'predictor': 3, 'BIGTIFF': 'IF_SAFER'
+        }
+        angle = [0, np.pi/4, np.pi/2, 3*np.pi/4]
+        outputs = {}
+        for window_size in window_sizes:
+            out_dir = os.path.join(self.map_dir, band_name, f"{window_size}x{window_size}")
+            os.makedirs(out_dir, exist_ok=True)
+            out_file = os.path.join(out_dir, f"{stem}_texture.tif")
+            # 先写入临时文件，全部块写完后改名，中断时不会留下不完整的纹理图
+            temp_file = os.path.join(out_dir, f".{stem}_texture.tif.tmp")
+            try:
+                with _open_raster(temp_file, 'w', **profile) as dst:
+                    dst.descriptions = tuple(names)
+                    for top, left, feature_maps in iter_glcm_tiles(
+                            img_norm, 0, 255, 64, window_size, self.steps, angle, features,
+                            tile_size=MAP_TILE_SIZE, mode='direct', mask=mask):
+                        for i, feature in enumerate(features):
+                            values = np.mean(feature_maps[feature], axis=1)
+                            th, tw = values.shape[1:]
+                            for j in range(len(self.steps)):
+                                dst.write(values[j], i * len(self.steps) + j + 1,
+                                          window=Window(left, top, tw, th))
+                os.replace(temp_file, out_file)
+            except Exception as e:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+                raise ValueError(f"纹理图保存失败: {str(e)}")
+            outputs[window_size] = out_file
+            self.report.append(f"{label} 纹理图: {out_file}")
+        return outputs
+
+    def _read_georef(self, img_path):
+        # 纹理图沿用源影像的坐标系和地理变换，非GeoTIFF或无地理参考时为像素坐标
+        if img_path.lower().endswith(('.tif', '.tiff')):
+            try:
+                with _open_raster(img_path) as src:
+                    return src.crs, src.transform
+            except rasterio.errors.RasterioError:
+                pass
+        return None, rasterio.Affine.identity()
+
+    def _normalize(self, img, block_rows=256):
+        # 改进的归一化处理
+        img_min = np.min(img)
+        img_max = np.max(img)
+        if img_max - img_min < 1e-8:
+            raise ValueError("图像灰度范围不足")
+
+        # 线性拉伸到0-255，不生成整幅的float64临时数组：
+        # 整数影像（如uint16反射率）对min..max的每个取值算一次，再用查找表映射；
+        # 其余按行分块计算。两种方式逐像素的运算与整幅计算相同，结果一致
+        img_norm = np.empty(img.shape, dtype=np.uint8)
+        if np.issubdtype(img.dtype, np.integer) and int(img_max) - int(img_min) < (1 << 16):
+            levels = np.arange(int(img_max) - int(img_min) + 1)
+            lut = np.uint8(255.0 * levels / (int(img_max) - int(img_min) + 1e-8))
+            for r in range(0, img.shape[0], block_rows):
+                img_norm[r:r + block_rows] = lut[img[r:r + block_rows].astype(np.int64) - int(img_min)]
+            return img_norm
+        for r in range(0, img.shape[0], block_rows):
+            img_norm[r:r + block_rows] = 255.0 * (img[r:r + block_rows] - img_min) / (img_max - img_min + 1e-8)
+        return img_norm
+
+    def process_image_plot(self, img_path):
+        img, img_norm = self._read_normalized(img_path)
+        mask = self._read_valid_mask(img_path, img)
+        # 原始数据类型的影像只用于判断背景，计算前释放
+        del img
+        return self._texture_plot(img_norm, mask)
+
+    def _texture_plot(self, img_norm, mask):
+        # 地块整体纹理：掩膜内所有有效像素对计入同一个共生矩阵，不需要滑动窗口和边缘去除
+        bbox = mask_bbox(mask)
+        if bbox is None:
+            raise ValueError("掩膜内没有有效像素")
+        top, bottom, left, right = bbox
+        img_norm = img_norm[top:bottom, left:right]
+        mask = mask[top:bottom, left:right]
+
+        angle = [0, np.pi/4, np.pi/2, 3*np.pi/4]
+        features = [f for f in self.features if f in GLCM_FEATURES]
+        try:
+            glcm = calcu_glcm_plot(img_norm, mi=0, ma=255, nbit=64, step=self.steps, angle=angle, mask=mask)
+            feature_maps = calcu_glcm_features(glcm, 64, features)
+        except Exception as e:
+            raise ValueError(f"特征计算失败: {str(e)}")
+        # 形状为(step, angle)，每个距离平均所有方向
+        return {self._feature_column(f, step): float(np.mean(feature_maps[f][i]))
+                for f in features for i, step in enumerate(self.steps)}
+
+    def _feature_column(self, feature, step):
+        # 只计算默认距离1时保持原来的列名，其余距离都带距离后缀，不同距离的结果不会写入同名的列
+        return feature if self.steps == [1] else f"{feature}_d{step}"
+
+    def process_image_windows(self, img_path, window_sizes):
+        img, img_norm = self._read_normalized(img_path)
+        mask = self._read_valid_mask(img_path, img) if self.use_mask else None
+        del img
+        return self._texture_windows(os.path.basename(img_path), img_norm, mask, window_sizes)
+
+    def _texture_windows(self, label, img_norm, mask, window_sizes):
+        # 金字塔模式：先降采样到设定的层级
+        if self.pyramid > 1:
+            img_norm, mask = build_pyramid(img_norm, [self.pyramid], mask)[self.pyramid]
+        return self._texture_windows_level(label, img_norm, mask, window_sizes, self.pyramid)
+
+    def _level_params(self, window_sizes, factor):
+        # 降采样factor倍的层级上，窗口、GLCM距离和边缘去除宽度按倍数缩小，覆盖的地面范围与原始分辨率相近
+        # 返回({原始窗口尺寸: 层级窗口尺寸}, 层级距离, 边缘去除宽度)
+        level_windows = {ws: pyramid_window(ws, factor) for ws in window_sizes}
+        steps = [max(1, int(round(step / factor))) for step in self.steps]
+        # 距离不小于窗口时0°方向（对角线方向在较大距离时）的像素对超出窗口，共生矩阵为空，
+        # 该方向的特征为0，会拉低方向平均，直接拒绝
+        level = f"金字塔{factor}x层级上" if factor > 1 else ""
+        for ws in level_windows.values():
+            if max(steps) >= ws:
+                raise ValueError(f"{level}GLCM距离{max(steps)}不小于窗口尺寸{ws}x{ws}，请选择更小的距离或更大的窗口")
+        return level_windows, steps, max(1, int(round(11 / factor)))
+
+    def _texture_windows_level(self, label, img_norm, mask, window_sizes, factor=1):
+        # factor为img_norm相对原始影像的降采样倍数，结果仍按原始窗口尺寸和距离输出
+        level_windows, steps, margin = self._level_params(window_sizes, factor)
+        window_sizes = sorted(set(level_windows.values()))
+        if factor > 1:
+            label = f"{label} 金字塔{factor}x"
+
+        # 有效像素掩膜，裁剪到掩膜外接矩形并保留半个最大窗口的真实邻域，
+        # 跨越矩形边界的窗口读到的是真实背景像素而不是扩充像素，仍被判为无效
+        if mask is not None:
+            bbox = mask_bbox(mask, max(window_sizes) // 2)
+            if bbox is None:
+                raise ValueError("掩膜内没有有效像素")
+            top, bottom, left, right = bbox
+            img_norm = img_norm[top:bottom, left:right]
+            mask = mask[top:bottom, left:right]
+
+        # GLCM参数设置（与原始代码严格一致）
+        glcm_params = {
+            'mi': 0,
+            'ma': 255,
+            'nbit': 64,
+            'step': steps,  # 原始代码固定为[1]，所有距离共用一次量化
+            'angle': [0, np.pi/4, np.pi/2, 3*np.pi/4]  # 四个方向
+        }
+
+        features = [f for f in self.features if f in GLCM_FEATURES]
+
+        # 内存预检：预估峰值内存，超出可用内存时自动改用direct模式或分块计算
+        plan = plan_glcm_job(img_norm.shape, glcm_params['nbit'], window_sizes,
+                             glcm_params['step'], glcm_params['angle'], features,
+                             self.glcm_mode, workers=self.threads, average='angle',
+                             budget=self.memory_budget)
+        self.report.append(self._plan_summary(label, img_norm.shape, window_sizes, steps, plan))
+
+        # 所有选中特征一次得到，形状为(step, angle, h, w)，随后平均所有方向（与原始代码逻辑一致），每个距离分开
+        window_maps = {}
+        if plan['tile_size'] is not None or plan['workers'] > 1:
+            # 分块计算；多进程时整幅图像按行带分给各进程，所有窗口尺寸共用一个进程池；内存不足时按预检的块大小
+            workers = plan['workers']
+            if workers > 1:
+                workers = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+            try:
+                for window_size in window_sizes:
+                    tile_size = plan['tile_size'] or row_bands(img_norm.shape, plan['workers'], window_size)
+                    try:
+                        window_maps[window_size] = calcu_glcm_tiled(
+                            img_norm, slide_window=window_size, features=features,
+                            tile_size=tile_size, mode=plan['mode'], average='angle',
+                            mask=mask, workers=workers, **glcm_params)
+                    except Exception as e:
+                        raise ValueError(f"特征计算失败: {str(e)}")
+            finally:
+                if plan['workers'] > 1:
+                    workers.shutdown()
+        elif plan['mode'] == 'direct':
+            try:
+                maps = calcu_glcm_direct_multiwindow(
+                    img_norm, slide_windows=window_sizes, features=features, mask=mask, **glcm_params)
+            except Exception as e:
+                raise ValueError(f"特征计算失败: {str(e)}")
+            for window_size, feature_maps in maps.items():
+                window_maps[window_size] = {f: np.mean(m, axis=1) for f, m in feature_maps.items()}
+        else:
+            for window_size in window_sizes:
+                try:
+                    # 小窗口的共生矩阵几乎全为0，改用稀疏的像素对编码列表；
+                    # 大窗口的对称共生矩阵只保存上三角的整数计数，归一化在特征计算中完成
+                    if window_size <= SPARSE_MAX_WINDOW:
+                        glcm = calcu_glcm_sparse(img_norm, slide_window=window_size, **glcm_params)
+                    else:
+                        glcm = calcu_glcm_packed(img_norm, slide_window=window_size, normed=False,
+                                                 **glcm_params)
+                except Exception as e:
+                    raise ValueError(f"GLCM计算失败: {str(e)}")
+
+                try:
+                    feature_maps = calcu_glcm_features(glcm, glcm_params['nbit'], features)
+                except Exception as e:
+                    raise ValueError(f"特征计算失败: {str(e)}")
+                del glcm
+                window_maps[window_size] = {f: np.mean(m, axis=1) for f, m in feature_maps.items()}
+                if mask is not None:
+                    inner = valid_window_mask(mask, window_size)
+                    for avg_feature in window_maps[window_size].values():
+                        avg_feature[:, ~inner] = np.nan
+
+        window_results = self._window_means(window_maps, mask, features, margin)
+        return {ws: window_results[level] for ws, level in level_windows.items()}
+
+    def _window_means(self, window_maps, mask, features, margin=11):
+        # 每个窗口尺寸、特征和距离的纹理图（已平均所有方向）取均值
+        # 特征计算：边缘去除值、均值计算时排除的值
+        feature_processors = {
+            "MEA": (0, 0),
+            "VAR": (0, 0),
+            "HOM": (1, 1),
+            "CON": (0, 0),
+            "DIS": (0, 0),
+            "ENT": (0, 0),
+            "COR": (0, 0),
+            "SEM": (1, 1)
+        }
+        window_results = {}
+        for window_size, feature_maps in window_maps.items():
+            results = {}
+            for feature in features:
+                edge_val, mean_val = feature_processors[feature]
+                try:
+                    for i, step in enumerate(self.steps):
+                        avg_feature = feature_maps[feature][i]
+                        column = self._feature_column(feature, step)
+                        if mask is not None:
+                            # 窗口包含背景的像素已为NaN，相当于Edge_Remove去除的边缘
+                            if np.isnan(avg_feature).all():
+                                raise ValueError(f"掩膜内没有完整的{window_size}x{window_size}窗口")
+                            results[column] = np.nanmean(avg_feature, dtype=np.float64)
+                            continue
+                        cleaned_data = Edge_Remove(avg_feature, edge_val, margin)
+                        final_value = calcu_txt_mean(cleaned_data, mean_val)
+                        results[column] = final_value
+                except Exception as e:
+                    raise ValueError(f"特征[{feature}]计算失败: {str(e)}")
+            window_results[window_size] = results
+
+        return window_results
+
+    def process_batch(self, sources, window_sizes):
+        # 多个小地块合并计算：尺寸相近的地块扩充到同一尺寸，组成(n, h, w)批量，
+        # 像素对编码、积分图和滑动直方图在整批上一次计算；window_sizes为None时计算地块整体GLCM
+        # 返回[(图像或地块, 与逐个计算相同的结果, 错误信息)]
+        items, errors, item_results = [], {}, {}
+        for index, source in enumerate(sources):
+            try:
+                for name, img_norm, mask in self._read_source(source, window_sizes is None or self.use_mask):
+                    # 地块整体GLCM不使用金字塔
+                    factor = 1 if window_sizes is None else self.pyramid
+                    if factor > 1:
+                        img_norm, mask = build_pyramid(img_norm, [factor], mask)[factor]
+                    # 使用掩膜时裁剪到掩膜外接矩形，与逐个计算相同：滑动窗口保留半个最大窗口的真实邻域，
+                    # 扩充到统一尺寸时复制的是背景或影像真实边界，跨越矩形边界的窗口仍判为无效
+                    if mask is not None:
+                        margin = 0 if window_sizes is None else max(
+                            self._level_params(window_sizes, factor)[0].values()) // 2
+                        bbox = mask_bbox(mask, margin)
+                        if bbox is None:
+                            raise ValueError("掩膜内没有有效像素")
+                        top, bottom, left, right = bbox
+                        img_norm, mask = img_norm[top:bottom, left:right], mask[top:bottom, left:right]
+                    # 内存预检：单幅计算也需要分块的大地块不参与批量计算，按单幅流程预检和分块
+                    if window_sizes is not None and self._batch_plan(img_norm.shape, window_sizes)['tile_size'] is not None:
+                        label = _source_name(source) if name is None else f"{_source_name(source)} [{name}]"
+                        self.report.append(f"{label}: 单幅计算需要分块，改为逐个计算")
+                        item_results.setdefault(index, {})[name] = self._texture_windows_level(
+                            label, img_norm, mask, window_sizes, factor)
+                        continue
+                    items.append((index, name, img_norm, mask))
+            except Exception as e:
+                errors[index] = str(e)
+
+        # 按扩充后的尺寸分组
+        groups = {}
+        for item in items:
+            h, w = item[2].shape
+            shape = (-(-h // BATCH_SHAPE_STEP) * BATCH_SHAPE_STEP, -(-w // BATCH_SHAPE_STEP) * BATCH_SHAPE_STEP)
+            groups.setdefault(shape, []).append(item)
+
+        for shape, group in groups.items():
+            n_values = shape[0] * shape[1] * 4 * len(self.steps) * len(self.features) * len(window_sizes or [1])
+            size = max(1, BATCH_MAX_VALUES // n_values)
+            if window_sizes is not None:
+                # 每批的峰值内存约为单幅预计峰值乘以批量大小，不超过内存预算
+                plan = self._batch_plan(shape, window_sizes)
+                if plan['budget'] is not None:
+                    size = max(1, min(size, plan['budget'] // max(plan['estimate'], 1)))
+            for b in range(0, len(group), size):
+                batch = group[b:b + size]
+                try:
+                    if window_sizes is None:
+                        results = self._batch_plot(shape, batch)
+                    else:
+                        results = self._batch_windows(shape, batch, window_sizes)
+                except Exception as e:
+                    for index, _, _, _ in batch:
+                        errors.setdefault(index, str(e))
+                    continue
+                for (index, name, _, _), result in zip(batch, results):
+                    item_results.setdefault(index, {})[name] = result
+        self.report.append(f"批量计算: {len(sources)} 个图像, 尺寸分组 "
+                           + ", ".join(f"{h}x{w}: {len(group)}" for (h, w), group in groups.items()))
+
+        outputs = []
+        for index, source in enumerate(sources):
+            if index in errors:
+                outputs.append((source, None, errors[index]))
+            elif isinstance(source, PlotChip) or self.band_map is not None:
+                outputs.append((source, item_results[index], None))
+            else:
+                outputs.append((source, item_results[index][None], None))
+        return outputs
+
+    def _read_source(self, source, use_mask):
+        # 读取一个图像或地块，返回[(波段名称, 归一化图像, 掩膜)]，单波段文件的波段名称为None，
+        # use_mask为False时掩膜为None
+        if isinstance(source, PlotChip):
+            bands, mask, _ = self._read_plot_chip(source)
+        elif self.band_map is not None:
+            bands, mask = self._read_multiband(source)
+        else:
+            img, img_norm = self._read_normalized(source)
+            mask = self._read_valid_mask(source, img) if use_mask else None
+            bands = {None: img_norm}
+        items = []
+        for name, band in bands.items():
+            try:
+                img_norm = band if name is None else self._normalize(band)
+            except Exception as e:
+                raise ValueError(f"波段[{name}]: {str(e)}")
+            items.append((name, img_norm, mask if use_mask else None))
+        return items
+
+    def _batch_plot(self, shape, batch):
+        # 扩充部分掩膜为False，不计入任何像素对
+        imgs = np.zeros((len(batch),) + shape, dtype=np.uint8)
+        masks = np.zeros((len(batch),) + shape, dtype=bool)
+        for k, (_, _, img_norm, mask) in enumerate(batch):
+            h, w = img_norm.shape
+            imgs[k, :h, :w] = img_norm
+            masks[k, :h, :w] = mask
+        angle = [0, np.pi/4, np.pi/2, 3*np.pi/4]
+        features = [f for f in self.features if f in GLCM_FEATURES]
+        glcm = calcu_glcm_plot(imgs, mi=0, ma=255, nbit=64, step=self.steps, angle=angle, mask=masks)
+        feature_maps = calcu_glcm_features(glcm, 64, features)
+        # 形状为(step, angle, n)
+        return [{self._feature_column(f, step): float(np.mean(feature_maps[f][i, :, k]))
+                 for f in features for i, step in enumerate(self.steps)}
+                for k in range(len(batch))]
+
+    def _batch_plan(self, shape, window_sizes):
+        # 一幅图像（已降采样到金字塔层级）按批量方式（direct，所有窗口一次计算）的内存预检
+        level_windows, steps, _ = self._level_params(window_sizes, self.pyramid)
+        features = [f for f in self.features if f in GLCM_FEATURES]
+        return plan_glcm_job(shape, 64, sorted(set(level_windows.values())), steps,
+                             [0, np.pi/4, np.pi/2, 3*np.pi/4], features, 'direct',
+                             average='angle', budget=self.memory_budget)
+
+    def _batch_windows(self, shape, batch, window_sizes):
+        # 扩充部分复制图像边缘，与单幅计算时的边界扩充相同，裁剪回原尺寸后结果不变
+        masked = batch[0][3] is not None
+        level_windows, steps, margin = self._level_params(window_sizes, self.pyramid)
+        window_sizes = sorted(set(level_windows.values()))
+        imgs = np.empty((len(batch),) + shape, dtype=np.uint8)
+        masks = np.empty((len(batch),) + shape, dtype=bool) if masked else None
+        for k, (_, _, img_norm, mask) in enumerate(batch):
+            h, w = img_norm.shape
+            pad = ((0, shape[0] - h), (0, shape[1] - w))
+            imgs[k] = np.pad(img_norm, pad, mode='edge')
+            if masked:
+                masks[k] = np.pad(mask, pad, mode='edge')
+        features = [f for f in self.features if f in GLCM_FEATURES]
+        maps = calcu_glcm_direct_batch(imgs, 0, 255, 64, window_sizes, steps,
+                                       [0, np.pi/4, np.pi/2, 3*np.pi/4], features, masks=masks)
+        results = []
+        for k, (_, _, img_norm, mask) in enumerate(batch):
+            h, w = img_norm.shape
+            window_maps = {ws: {f: np.mean(maps[ws][f][k, :, :, :h, :w], axis=1) for f in features}
+                           for ws in window_sizes}
+            window_results = self._window_means(window_maps, mask, features, margin)
+            results.append({ws: window_results[level] for ws, level in level_windows.items()})
+        return results
+
+    def pyramid_report(self, source, window_sizes, is_running=None):
+        # 速度/精度对比：一幅图像（第一个波段）的样本上金字塔各层级只构建一次，
+        # 分别在原始分辨率和各层级上计算，记录耗时和相对原始分辨率的误差，供选择层级参考
+        # is_running: 每个层级计算前调用，返回False时停止对比
+        name, img_norm, mask = self._read_source(source, self.use_mask)[0]
+        label = _source_name(source) if name is None else f"{_source_name(source)} [{name}]"
+        # 大影像只取中心不超过PYRAMID_SAMPLE_SIZE见方的样本，对比耗时不超过一幅样本的原始分辨率计算
+        bbox = mask_bbox(mask) if mask is not None else None
+        top, bottom, left, right = bbox or (0, img_norm.shape[0], 0, img_norm.shape[1])
+        H, W = img_norm.shape
+        h, w = min(H, PYRAMID_SAMPLE_SIZE), min(W, PYRAMID_SAMPLE_SIZE)
+        top = min(max(0, (top + bottom - h) // 2), H - h)
+        left = min(max(0, (left + right - w) // 2), W - w)
+        if (h, w) != (H, W):
+            label = f"{label} 中心样本"
+            img_norm = img_norm[top:top + h, left:left + w]
+            if mask is not None:
+                mask = mask[top:top + h, left:left + w]
+        levels = {1: (img_norm, mask)}
+        levels.update(build_pyramid(img_norm, PYRAMID_LEVELS, mask))
+        lines = [f"金字塔层级速度/精度对比: {label} ({img_norm.shape[0]}x{img_norm.shape[1]}), "
+                 f"窗口: {', '.join(f'{ws}x{ws}' for ws in window_sizes)}"]
+        baseline = None
+        for factor, (level_img, level_mask) in levels.items():
+            if is_running is not None and not is_running():
+                lines.append("  已停止")
+                break
+            level_windows, steps, _ = self._level_params(window_sizes, factor)
+            setting = (f"{factor}x ({level_img.shape[0]}x{level_img.shape[1]}, "
+                       f"窗口 {', '.join(f'{ws}x{ws}' for ws in level_windows.values())}, "
+                       f"距离 {', '.join(str(step) for step in steps)})")
+            start = time.perf_counter()
+            try:
+                results = self._texture_windows_level(label, level_img, level_mask, window_sizes, factor)
+            except Exception as e:
+                lines.append(f"  {setting}: 计算失败: {str(e)}")
+                continue
+            elapsed = time.perf_counter() - start
+            if factor == 1:
+                baseline = (elapsed, results)
+                lines.append(f"  {setting}: 耗时 {elapsed:.2f} s（基准）")
+                continue
+            if baseline is None:
+                lines.append(f"  {setting}: 耗时 {elapsed:.2f} s")
+                continue
+            errors = {(ws, column): abs(value - baseline[1][ws][column]) / max(abs(baseline[1][ws][column]), 1e-12)
+                      for ws in results for column, value in results[ws].items()}
+            (ws, column), worst = max(errors.items(), key=lambda item: np.nan_to_num(item[1], nan=np.inf))
+            # 每个特征的平均相对误差（所有窗口和距离），不同特征对降采样的敏感程度差别较大
+            by_feature = {}
+            for (_, col), error in errors.items():
+                by_feature.setdefault(col.split('_d')[0], []).append(error)
+            lines.append(f"  {setting}: 耗时 {elapsed:.2f} s（加速{baseline[0] / max(elapsed, 1e-9):.1f}倍）, "
+                         f"平均相对误差 "
+                         + ", ".join(f"{f} {np.nanmean(e):.1%}" for f, e in by_feature.items())
+                         + f"; 最大 {worst:.1%}（{ws}x{ws} {column}）")
+        self.report += lines
+
+    def _read_valid_mask(self, img_path, img):
+        # 优先使用影像自带的nodata/掩膜（预处理输出的地块影像nodata=0），否则以0值像素为背景
+        if img_path.lower().endswith(('.tif', '.tiff')):
+            try:
+                with _open_raster(img_path) as src:
+                    if MaskFlags.all_valid not in src.mask_flag_enums[0]:
+                        mask = src.read_masks(1) > 0
+                        if mask.shape == img.shape:
+                            return mask
+            except rasterio.errors.RasterioError:
+                pass
+        return img != 0
+
+    def _plan_summary(self, label, shape, window_sizes, steps, plan):
+        mb = 1024 * 1024
+        budget = "未知" if plan['budget'] is None else f"{plan['budget'] / mb:.0f} MB"
+        chosen = plan['mode'] if plan['tile_size'] is None else f"{plan['mode']} 分块{plan['tile_size']}"
+        return (f"{label} ({shape[0]}x{shape[1]}) "
+                f"窗口: {', '.join(f'{ws}x{ws}' for ws in window_sizes)}; "
+                f"距离: {', '.join(str(step) for step in steps)}; 请求方式: {self.glcm_mode}; 预计峰值: {plan['estimate'] / mb:.0f} MB; "
+                f"内存预算: {budget}; 采用: {chosen}, 进程数 {plan['workers']}")
+
+
+# 子进程入口（需为模块级函数）：处理一个(图像或正射影像中的地块, 窗口尺寸组)任务，
+# window_sizes为None时计算地块整体GLCM，返回(结果, 运行报告)
+def _run_texture_task(task, img_path, window_sizes):
+    task.report = []
+    if isinstance(img_path, list):
+        # 批量任务：img_path为图像或地块的列表
+        results = task.process_batch(img_path, window_sizes)
+    elif isinstance(img_path, PlotChip):
+        results = task.process_plot_chip(img_path, window_sizes)
+    elif task.band_map is not None:
+        results = task.process_multiband(img_path, window_sizes)
+    elif window_sizes is None:
+        results = task.process_image_plot(img_path)
+    elif task.map_dir is not None:
+        results = task.process_image_maps(img_path, window_sizes)
+    else:
+        results = task.process_image_windows(img_path, window_sizes)
+    return results, task.report
+
+
+def _run_texture_task_safe(args):
+    # 进程池中的任务不抛出异常，错误信息随结果一起返回
+    task, img_path, window_sizes = args
+    try:
+        results, report = _run_texture_task(task, img_path, window_sizes)
+        return img_path, window_sizes, results, report, None
+    except Exception as e:
+        return img_path, window_sizes, None, [], str(e)
+
+
+
+# 断点续算清单：每行一个结果已写入文件的(图像路径, 大小, 修改时间, 窗口, 计算参数)
+class TextureCheckpoint:
+    def __init__(self, output_path):
+        self.path = os.path.join(output_path, "texture_checkpoint.jsonl")
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return set()
+        # 上次运行中断时最后一行可能不完整，补上换行，之后追加的记录从新的一行开始
+        with open(self.path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+        with open(self.path, encoding='utf-8') as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def mark(self, keys):
+        if not keys:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(key + '\n' for key in keys))
+
+
+# 纹理特征结果的批量写入：按 波段/窗口 文件夹缓存记录，累计到一定行数或时间后一次写入，
+# 运行中途崩溃时最多丢失最近一批结果
+class TextureResultSink:
+    def __init__(self, output_path, fmt='csv', flush_rows=2000, flush_seconds=30, checkpoint=None):
+        if fmt not in ('csv', 'parquet'):
+            raise ValueError(f"未知的输出格式: {fmt}")
+        if fmt == 'parquet' and not any(importlib.util.find_spec(m) for m in ('pyarrow', 'fastparquet')):
+            raise ValueError("保存为Parquet需要安装pyarrow或fastparquet")
+        self.output_path = output_path
+        self.fmt = fmt
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self._buffers = {}
+        # 已有CSV文件的列名，只在第一次写入时读取表头
+        self._columns = {}
+        self._rows = 0
+        self._last_flush = time.monotonic()
+        # 断点续算：任务的所有记录都写入文件后才记入清单
+        self.checkpoint = checkpoint
+        self._pending = {}
+        self._uncommitted = set()
+
+    def add(self, band_name, window_name, record):
+        window_dir = os.path.join(self.output_path, band_name, window_name)
+        self._buffers.setdefault(window_dir, []).append(record)
+        self._uncommitted.add(window_dir)
+        self._rows += 1
+        if self._rows >= self.flush_rows:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        # 定时写入：除加入记录时外，每个任务完成时和等待子进程结果时也检查，
+        # 计算较慢的图像期间之前的结果不会一直留在内存中
+        if self._buffers and time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        # 写入失败的文件保留缓存，下次写入时重试
+        errors = []
+        for window_dir, records in list(self._buffers.items()):
+            try:
+                os.makedirs(window_dir, exist_ok=True)
+                df = pd.DataFrame(records)
+                if self.fmt == 'csv':
+                    self._write_csv(os.path.join(window_dir, "texture_features.csv"), df)
+                else:
+                    self._write_parquet(os.path.join(window_dir, "texture_features.parquet"), df)
+                del self._buffers[window_dir]
+            except Exception as e:
+                errors.append(f"{window_dir}: {str(e)}")
+        self._rows = sum(len(records) for records in self._buffers.values())
+        self._last_flush = time.monotonic()
+        if self.checkpoint is not None:
+            done = [key for key, dirs in self._pending.items() if not dirs & self._buffers.keys()]
+            self.checkpoint.mark(done)
+            for key in done:
+                del self._pending[key]
+        if errors:
+            raise IOError("; ".join(errors))
+
+    def commit(self, key):
+        # 上次commit之后加入的记录属于key，这些记录所在的文件都写入后key记入断点清单
+        dirs, self._uncommitted = self._uncommitted, set()
+        if self.checkpoint is not None and not dirs & self._buffers.keys():
+            # 没有尚未写入的记录（如逐像素纹理图已写入GeoTIFF，不加入表格记录）时立即记入清单，
+            # 运行中途被结束时已完成的任务不会重新计算
+            self.checkpoint.mark([key])
+        else:
+            self._pending[key] = dirs
+        self.flush_if_due()
+
+    def _write_csv(self, output_file, df):
+        columns = self._columns.get(output_file)
+        if columns is None and os.path.exists(output_file):
+            columns = list(pd.read_csv(output_file, nrows=0).columns)
+        if columns is None:
+            df.to_csv(output_file, index=False)
+            columns = list(df.columns)
+        elif set(df.columns) <= set(columns):
+            df.reindex(columns=columns).to_csv(output_file, mode='a', header=False, index=False)
+        else:
+            # 出现新的特征列（如换了特征或距离后输出到同一文件夹）时合并已有结果重写文件，表头与各行保持一致
+            df = pd.concat([pd.read_csv(output_file), df], ignore_index=True)
+            df.to_csv(output_file + ".tmp", index=False)
+            os.replace(output_file + ".tmp", output_file)
+            columns = list(df.columns)
+        self._columns[output_file] = columns
+
+    def _write_parquet(self, output_dir, df):
+        # Parquet不能追加，每批写为目录中的一个分片，pd.read_parquet(目录)读取全部结果；
+        # 先写入以'.'开头的临时文件再改名，读取时不会读到写了一半的分片
+        os.makedirs(output_dir, exist_ok=True)
+        part = len([f for f in os.listdir(output_dir) if f.endswith('.parquet')])
+        output_file = os.path.join(output_dir, f"part-{part:05d}.parquet")
+        temp_file = os.path.join(output_dir, f".part-{part:05d}.parquet.tmp")
+        df.to_parquet(temp_file, index=False)
+        os.replace(temp_file, output_file)
+
+
 class CalculationThread(QThread):
     progress_updated = pyqtSignal(int, int, str)
     calculation_finished = pyqtSignal()
     error_occurred = pyqtSignal(str)
 
-    def __init__(self, root_path, window_sizes, features, output_path, parent=None):
+    def __init__(self, root_path, window_sizes, features, output_path, glcm_mode='dense',
+                 use_mask=False, texture_scope='window', steps=(1,), workers=1, band_map=None,
+                 output_format='csv', resume=True, ortho_path=None, shp_path=None, plot_field='name', batch=False,
+                 pyramid=1, parent=None):
             super().__init__(parent)
             self.root_path = root_path
             self.window_sizes = [ws for ws in window_sizes if ws % 2 == 1]
-            self.features = features
             self.output_path = output_path  # 新增输出路径
+            # 金字塔模式只用于滑动窗口纹理取均值
+            pyramid = int(pyramid) if texture_scope == 'window' else 1
+            self.task = TextureTask(features, glcm_mode, use_mask, steps, band_map=band_map,
+                                    map_dir=output_path if texture_scope == 'map' else None, pyramid=pyramid)
+            if texture_scope != 'plot':
+                # 距离超出窗口时在启动前报错
+                self.task._level_params(self.window_sizes, pyramid)
+            # 结果按批写入CSV或Parquet，写入后记入断点续算清单
+            self.checkpoint = TextureCheckpoint(output_path)
+            self.sink = TextureResultSink(output_path, output_format, checkpoint=self.checkpoint)
+            # 跳过清单中已完成的(图像, 窗口)；参数不同（特征、距离、掩膜等）时重新计算
+            self.resume = resume
+            self._config = {"features": sorted(features), "steps": self.task.steps, "mask": use_mask,
+                            "scope": texture_scope, "bands": band_map, "format": output_format}
+            if pyramid > 1:
+                # 金字塔层级的结果为近似值，与原始分辨率的结果分开记录
+                self._config["pyramid"] = pyramid
+            # 'window': 滑动窗口纹理图取均值；'plot': 整个地块影像只计算一个共生矩阵；
+            # 'map': 滑动窗口纹理图按块写入GeoTIFF，不计算均值
+            self.texture_scope = texture_scope
+            # 并行进程数，1时在本线程中逐个处理
+            self.workers = max(1, int(workers))
+            # 正射影像+地块矢量：按地块直接读取正射影像的窗口计算，不需要预处理裁剪出的地块影像
+            self.ortho_path = ortho_path
+            self.shp_path = shp_path
+            self.plot_field = plot_field
+            # 小地块批量计算：多个图像（地块）合并为一个任务，按尺寸分组后整批计算；逐像素纹理图不使用
+            self.batch = batch and texture_scope != 'map'
+            self.report = []
             self._is_running = True
 
     def run(self):
         try:
             all_files = []
             valid_extensions = ('.tif', '.tiff', '.png', '.jpg', '.jpeg')
-            for root, _, files in os.walk(self.root_path):
-                for file in files:
-                    if file.lower().endswith(valid_extensions):
-                        full_path = os.path.join(root, file)
-                        if os.path.getsize(full_path) > 0:
-                            all_files.append(full_path)
-                        else:
-                            self.error_occurred.emit(f"空文件: {file}")
-
-            total = len(all_files) * len(self.window_sizes)
-            processed = 0
-
+            if self.task.band_map is not None:
+                # 多波段影像用rasterio读取，只处理GeoTIFF
+                valid_extensions = ('.tif', '.tiff')
+            if self.ortho_path:
+                # 每个地块为一个任务；矢量文件修改后重新计算
+                all_files = _load_plot_chips(self.ortho_path, self.shp_path, self.plot_field)
+                shp_stat = os.stat(self.shp_path)
+                self._config["plots"] = [os.path.abspath(self.shp_path), shp_stat.st_size, shp_stat.st_mtime_ns,
+                                         self.plot_field]
+                self.report.append(f"正射影像: {self.ortho_path}; 地块矢量: {self.shp_path}; 地块数: {len(all_files)}")
+            else:
+                for root, _, files in os.walk(self.root_path):
+                    for file in files:
+                        if file.lower().endswith(valid_extensions):
+                            full_path = os.path.join(root, file)
+                            if os.path.getsize(full_path) > 0:
+                                all_files.append(full_path)
+                            else:
+                                self.error_occurred.emit(f"空文件: {file}")
+
+            # 断点续算：跳过清单中已完成的(图像, 窗口)，只计算缺少的部分
+            windows = ['plot'] if self.texture_scope == 'plot' else self.window_sizes
+            self.keys = {}
+            ortho_stat = os.stat(self.ortho_path) if self.ortho_path else None
             for img_path in all_files:
-                if not self._is_running:
-                    break
-
-                for window_size in self.window_sizes:
+                stat = ortho_stat or os.stat(img_path)
+                for ws in windows:
+                    self.keys[img_path, ws] = self._checkpoint_key(img_path, stat, ws)
+            done = self.checkpoint.load()
+            if not self.resume:
+                done = set()
+            todo = {img_path: [ws for ws in windows if self.keys[img_path, ws] not in done]
+                    for img_path in all_files}
+
+            # 任务为(图像, 窗口尺寸组)；direct模式下所有窗口尺寸共用一次读取、量化和像素对计数
+            tasks = []
+            if self.batch:
+                # 批量任务为(图像列表, 窗口尺寸组)，待计算窗口相同的图像合并；
+                # 图像数不足时减小每批的图像数，使每个进程都有任务
+                pending = {}
+                for img_path in all_files:
+                    if todo[img_path]:
+                        pending.setdefault(tuple(todo[img_path]), []).append(img_path)
+                n_pending = sum(len(sources) for sources in pending.values())
+                size = max(1, min(BATCH_SOURCES, -(-n_pending // self.workers)))
+                for window_sizes, sources in pending.items():
+                    window_sizes = None if self.texture_scope == 'plot' else list(window_sizes)
+                    tasks += [(sources[b:b + size], window_sizes) for b in range(0, len(sources), size)]
+            else:
+                for img_path in all_files:
+                    if not todo[img_path]:
+                        continue
+                    if self.texture_scope == 'plot':
+                        tasks.append((img_path, None))
+                    elif self.task.glcm_mode == 'direct' or self.texture_scope == 'map':
+                        # 纹理图按块计算，各窗口尺寸共用一次读取
+                        tasks.append((img_path, todo[img_path]))
+                    else:
+                        tasks += [(img_path, [ws]) for ws in todo[img_path]]
+
+            self.total = len(all_files) * len(windows)
+            self.processed = self.total - sum(len(ws) for ws in todo.values())
+            if self.processed:
+                self.report.append(f"断点续算: 跳过已完成的 {self.processed}/{self.total} 个(图像, 窗口)")
+                self.progress_updated.emit(self.processed, self.total, "跳过已完成的图像")
+
+            if self.task.pyramid > 1 and tasks and self._is_running:
+                # 先用第一幅待计算的图像对比各金字塔层级的速度和精度，写入运行报告
+                source = tasks[0][0][0] if self.batch else tasks[0][0]
+                self.progress_updated.emit(self.processed, self.total, "金字塔层级速度/精度对比")
+                try:
+                    self.task.report = []
+                    self.task.pyramid_report(source, todo[source], lambda: self._is_running)
+                    self.report += self.task.report
+                except Exception as e:
+                    self.report.append(f"金字塔层级速度/精度对比失败: {str(e)}")
+
+            n_parallel = len(tasks) if self.batch else sum(1 for ws in todo.values() if ws)
+            if self.workers > 1 and n_parallel >= self.workers:
+                self._run_parallel(tasks)
+            else:
+                # 图像数少于进程数时（如只有一幅大影像），改为在每幅图像内按行带多进程计算
+                self.task.threads = self.workers
+                for img_path, window_sizes in tasks:
+                    if not self._is_running:
+                        break
                     try:
-                        results = self.process_image(img_path, window_size)
-                        self.save_results(img_path, window_size, results)
-                        processed += 1
-                        self.progress_updated.emit(
-                            processed, total, 
-                            f"{os.path.basename(img_path)} ({window_size}x{window_size})"
-                        )
+                        results, report = _run_texture_task(self.task, img_path, window_sizes)
+                        self.report += report
+                        self._task_finished(img_path, window_sizes, results)
                     except Exception as e:
-                        self.error_occurred.emit(
-                            f"处理失败: {os.path.basename(img_path)}\n"
-                            f"窗口大小: {window_size}x{window_size}\n"
-                            f"错误详情: {str(e)}"
-                        )
-                        continue
+                        self._task_failed(img_path, window_sizes, e)
 
             self.calculation_finished.emit()
 
         except Exception as e:
             self.error_occurred.emit(f"运行时错误: {str(e)}")
         finally:
+            try:
+                self.sink.flush()
+            except Exception as e:
+                self.error_occurred.emit(f"结果保存失败: {str(e)}")
+            self._write_report()
             self._cleanup()
 
+    def _run_parallel(self, tasks):
+        # 各进程平分内存预算，每幅图像在自己的份额内选择计算方式
+        available = available_memory()
+        if available is not None:
+            self.task.memory_budget = int(0.7 * available) // self.workers
+        # spawn方式启动子进程，不复制Qt线程的状态，与Windows下的行为一致
+        executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        completed = False
+        try:
+            futures = [executor.submit(_run_texture_task_safe, (self.task, img_path, window_sizes))
+                       for img_path, window_sizes in tasks]
+            pending = set(futures)
+            # 结果在本线程中按完成顺序保存，CSV不会被多个进程同时写入
+            while pending and self._is_running:
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                if not done:
+                    try:
+                        self.sink.flush_if_due()
+                    except Exception as e:
+                        self.error_occurred.emit(f"结果保存失败: {str(e)}")
+                for future in done:
+                    try:
+                        img_path, window_sizes, results, report, error = future.result()
+                    except BrokenProcessPool:
+                        # 子进程被系统结束（如内存不足）或崩溃时，进程池中未完成的任务都无法再得到结果
+                        unfinished = sum(1 for f in futures if not f.done() or f.exception() is not None)
+                        self.error_occurred.emit(
+                            f"计算进程意外退出（可能内存不足），{unfinished} 个任务未完成\n"
+                            f"可减少并行进程数后勾选断点续算重新运行"
+                        )
+                        return
+                    try:
+                        if error is not None:
+                            raise ValueError(error)
+                        self.report += report
+                        self._task_finished(img_path, window_sizes, results)
+                    except Exception as e:
+                        self._task_failed(img_path, window_sizes, e)
+            completed = not pending
+        finally:
+            if completed:
+                executor.shutdown()
+            else:
+                # 停止计算或进程池损坏：取消未开始的任务，结束正在计算的子进程
+                processes = list((executor._processes or {}).values())
+                executor.shutdown(wait=False, cancel_futures=True)
+                for process in processes:
+                    process.terminate()
+
+    def _checkpoint_key(self, img_path, stat, window_size):
+        # 正射影像中的地块由(正射影像路径, 地块名称)确定，stat为正射影像的文件信息
+        if isinstance(img_path, PlotChip):
+            source = [os.path.abspath(img_path.ortho_path), img_path.name]
+        else:
+            source = os.path.abspath(img_path)
+        return json.dumps([source, stat.st_size, stat.st_mtime_ns, window_size, self._config],
+                          ensure_ascii=False, sort_keys=True)
+
+    def _task_finished(self, img_path, window_sizes, results):
+        if isinstance(img_path, list):
+            # 批量任务的结果为每个图像（地块）的(图像, 结果, 错误信息)，逐个保存
+            for source, source_results, error in results:
+                try:
+                    if error is not None:
+                        raise ValueError(error)
+                    self._task_finished(source, window_sizes, source_results)
+                except Exception as e:
+                    self._task_failed(source, window_sizes, e)
+            return
+        # 多波段影像和正射影像中的地块的结果为{波段名称: 结果}；单波段文件的波段名称由文件路径判断
+        if self.task.band_map is None and not isinstance(img_path, PlotChip):
+            results = {None: results}
+        if window_sizes is None:
+            for band_name, band_results in results.items():
+                self.save_results(img_path, 'plot', band_results, band_name)
+            self.sink.commit(self.keys[img_path, 'plot'])
+            self.processed += 1
+            self.progress_updated.emit(self.processed, self.total, f"{_source_name(img_path)} (地块整体)")
+            return
+        for window_size in window_sizes:
+            # 纹理图已由计算进程写入文件，没有需要保存的特征均值
+            if self.texture_scope != 'map':
+                for band_name, band_results in results.items():
+                    self.save_results(img_path, window_size, band_results[window_size], band_name)
+            self.sink.commit(self.keys[img_path, window_size])
+            self.processed += 1
+            self.progress_updated.emit(
+                self.processed, self.total,
+                f"{_source_name(img_path)} ({window_size}x{window_size})"
+            )
+
+    def _task_failed(self, img_path, window_sizes, e):
+        if isinstance(img_path, list):
+            self.error_occurred.emit(
+                f"处理失败: {len(img_path)} 个图像（批量计算）\n"
+                f"错误详情: {str(e)}"
+            )
+            return
+        if window_sizes is None:
+            self.error_occurred.emit(
+                f"处理失败: {_source_name(img_path)}\n"
+                f"错误详情: {str(e)}"
+            )
+            return
+        self.error_occurred.emit(
+            f"处理失败: {_source_name(img_path)}\n"
+            f"窗口大小: {', '.join(f'{ws}x{ws}' for ws in window_sizes)}\n"
+            f"错误详情: {str(e)}"
+        )
+
+
+    def _write_report(self):
+        if not self.report or not self.output_path:
+            return
+        try:
+            os.makedirs(self.output_path, exist_ok=True)
+            report_path = os.path.join(self.output_path, "texture_run_report.log")
+            with open(report_path, "a", encoding="utf-8") as f:
+                f.write(f"===== {datetime.datetime.now():%Y-%m-%d %H:%M:%S} =====\n")
+                f.write("\n".join(self.report) + "\n\n")
+        except Exception as e:
+            self.error_occurred.emit(f"运行报告保存失败: {str(e)}")
+
     def _cleanup(self):
         if hasattr(self, 'temp_files'):
             for f in self.temp_files:
@@ -87,120 +1178,38 @@ class CalculationThread(QThread):
         self.wait(5000)
 
     def process_image(self, img_path, window_size):
-        # 增强图像读取
-        try:
-            img = skimage.io.imread(img_path, as_gray=True)
-            if img is None or img.size == 0:
-                raise ValueError("无效的图像数据")
-        except Exception as e:
-            raise ValueError(f"图像读取失败: {str(e)}")
-
-        # 改进的归一化处理
-        img_min = np.min(img)
-        img_max = np.max(img)
-        if img_max - img_min < 1e-8:
-            raise ValueError("图像灰度范围不足")
-
-        img_norm = np.uint8(255.0 * (img - img_min) / (img_max - img_min + 1e-8))
-
-        # GLCM参数设置（与原始代码严格一致）
-        glcm_params = {
-            'mi': 0,
-            'ma': 255,
-            'nbit': 64,
-            'slide_window': window_size,
-            'step': [1],         # 原始代码固定参数
-            'angle': [0, np.pi/4, np.pi/2, 3*np.pi/4]  # 四个方向
-        }
-
-        try:
-            glcm = calcu_glcm(img_norm, **glcm_params)
-        except Exception as e:
-            raise ValueError(f"GLCM计算失败: {str(e)}")
-
-        # 特征计算（修复维度问题）
-        feature_processors = {
-            "MEA": (calcu_glcm_mean, 0, 0),
-            "VAR": (calcu_glcm_variance, 0, 0),
-            "HOM": (calcu_glcm_homogeneity, 1, 1),
-            "CON": (calcu_glcm_contrast, 0, 0),
-            "DIS": (calcu_glcm_dissimilarity, 0, 0),
-            "ENT": (calcu_glcm_entropy, 0, 0),
-            "COR": (calcu_glcm_correlation, 0, 0),
-            "SEM": (calcu_glcm_Second_Moment, 1, 1)
-        }
-
-        results = {}
-        for feature in self.features:
-            if feature not in feature_processors:
-                continue
-
-            func, edge_val, mean_val = feature_processors[feature]
-            try:
-                # 关键修复：处理多方向数据
-                feature_data = []
-                for i in range(glcm.shape[2]):  # step维度
-                    for j in range(glcm.shape[3]):  # angle维度
-                        glcm_slice = glcm[:, :, i, j, :, :]
-                        data = func(glcm_slice, 64)
-                        feature_data.append(data)
-                
-                # 平均所有方向和步长（与原始代码逻辑一致）
-                avg_feature = np.mean(feature_data, axis=0)
-                cleaned_data = Edge_Remove(avg_feature, edge_val)
-                final_value = calcu_txt_mean(cleaned_data, mean_val)
-                results[feature] = final_value
-            except Exception as e:
-                raise ValueError(f"特征[{feature}]计算失败: {str(e)}")
-
-        return results
+        return self.task.process_image(img_path, window_size)
 
 
-
-    def save_results(self, img_path, window_size, results):
+    def save_results(self, img_path, window_size, results, band_name=None):
         try:
             output_dir = self.output_path  # 使用传递的输出路径
             if not output_dir:
                 raise ValueError("请选择输出文件夹路径")
 
-            # 获取图像的波段信息（文件名如 Red, Green, Blue）
-            band_name = 'Unknown'
-            if 'Red' in img_path:
-                band_name = 'R'
-            elif 'Green' in img_path:
-                band_name = 'G'
-            elif 'Blue' in img_path:
-                band_name = 'B'
-            elif 'RedEdge' in img_path:
-                band_name = 'RE'
-            elif 'NIR' in img_path:
-                band_name = 'NIR'
-
-            # 生成波段文件夹路径
-            band_dir = os.path.join(output_dir, band_name)
-            os.makedirs(band_dir, exist_ok=True)
-
-            # 生成以窗口尺寸为基础的子文件夹
-            window_dir = os.path.join(band_dir, f"{window_size}x{window_size}")
-            os.makedirs(window_dir, exist_ok=True)
+            # 获取图像的波段信息（文件名如 Red, Green, Blue），多波段影像由波段对应关系给出
+            if band_name is None:
+                band_name = _guess_band_name(img_path)
+
+            # 生成以窗口尺寸为基础的子文件夹名称
+            # 地块整体模式（window_size='plot'）单独保存到plot文件夹
+            window_name = f"{window_size}x{window_size}" if isinstance(window_size, int) else str(window_size)
 
             # 生成特征名称列，如 B_VAR, R_VAR 等
             feature_columns = {f"{band_name}_{feature}": value for feature, value in results.items()}
 
             # 将文件名和计算的特征保存为数据
             record = {
-                "FileName": os.path.basename(img_path),
+                "FileName": _source_name(img_path),
                 "WindowSize": window_size,
                 **feature_columns
             }
+            if self.task.pyramid > 1:
+                # 金字塔层级上的近似结果，记录降采样倍数
+                record["Pyramid"] = self.task.pyramid
 
-            # 生成CSV文件路径
-            output_file = os.path.join(window_dir, "texture_features.csv")
-
-            df = pd.DataFrame([record])
-
-            write_header = not os.path.exists(output_file)
-            df.to_csv(output_file, mode='a', header=write_header, index=False)
+            # 记录先缓存，按批写入 波段/窗口/texture_features.csv
+            self.sink.add(band_name, window_name, record)
         except Exception as e:
             raise IOError(f"结果保存失败: {str(e)}")
 
@@ -302,6 +1311,102 @@ class TextureFeatureTab(QWidget):
         param_grid.addWidget(self.output_edit, 4, 1)
         param_grid.addWidget(self.output_btn, 4, 2)
 
+        # 共生矩阵计算方式
+        self.mode_label = QLabel("GLCM计算方式:")
+        self.mode_combo = QComboBox()
+        self.mode_combo.addItem("完整共生矩阵", "dense")
+        self.mode_combo.addItem("特征直接累加（低内存）", "direct")
+        param_grid.addWidget(self.mode_label, 5, 0)
+        param_grid.addWidget(self.mode_combo, 5, 1, 1, 2)
+
+        # 地块掩膜：跳过nodata背景像素
+        self.mask_check = QCheckBox("仅计算地块掩膜内的窗口（跳过nodata背景）")
+        param_grid.addWidget(self.mask_check, 6, 0, 1, 3)
+
+        # 纹理统计方式：滑动窗口纹理图或地块整体共生矩阵
+        self.scope_label = QLabel("纹理统计方式:")
+        self.scope_combo = QComboBox()
+        self.scope_combo.addItem("滑动窗口（逐像素纹理图取均值）", "window")
+        self.scope_combo.addItem("地块整体GLCM（每个地块一个共生矩阵）", "plot")
+        self.scope_combo.addItem("逐像素纹理图（分块写入GeoTIFF）", "map")
+        param_grid.addWidget(self.scope_label, 7, 0)
+        param_grid.addWidget(self.scope_combo, 7, 1, 1, 2)
+
+        # GLCM像素对距离，可多选
+        self.step_group = QGroupBox("GLCM距离（像素）")
+        step_layout = QHBoxLayout()
+        self.step_checks = {step: QCheckBox(str(step)) for step in (1, 2, 4, 8)}
+        self.step_checks[1].setChecked(True)
+        for cb in self.step_checks.values():
+            step_layout.addWidget(cb)
+        self.step_group.setLayout(step_layout)
+        param_grid.addWidget(self.step_group, 8, 0, 1, 3)
+
+        # 并行进程数：多幅图像同时计算
+        self.workers_label = QLabel("并行进程数:")
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, os.cpu_count() or 1)
+        self.workers_spin.setValue(1)
+        param_grid.addWidget(self.workers_label, 9, 0)
+        param_grid.addWidget(self.workers_spin, 9, 1, 1, 2)
+
+        # 多波段影像：一个GeoTIFF包含所有波段，按填写的波段顺序命名（'-'跳过该波段）
+        self.multiband_check = QCheckBox("多波段影像（每个文件包含所有波段），波段顺序:")
+        self.band_map_edit = QLineEdit("B,G,R,RE,NIR")
+        self.band_map_edit.setToolTip("按影像波段顺序填写波段名称，用逗号分隔；'-'表示跳过该波段，留空时使用影像的波段描述")
+        param_grid.addWidget(self.multiband_check, 10, 0)
+        param_grid.addWidget(self.band_map_edit, 10, 1, 1, 2)
+
+        # 结果文件格式
+        self.format_label = QLabel("输出格式:")
+        self.format_combo = QComboBox()
+        self.format_combo.addItem("CSV", "csv")
+        self.format_combo.addItem("Parquet（需要pyarrow）", "parquet")
+        param_grid.addWidget(self.format_label, 11, 0)
+        param_grid.addWidget(self.format_combo, 11, 1, 1, 2)
+
+        # 断点续算：输出文件夹中已完成的图像和窗口不再重复计算
+        self.resume_check = QCheckBox("断点续算（跳过输出文件夹中已完成的图像和窗口）")
+        self.resume_check.setChecked(True)
+        param_grid.addWidget(self.resume_check, 12, 0, 1, 3)
+
+        # 正射影像+地块矢量：按地块直接读取正射影像，不需要先执行预处理裁剪（此时不使用输入文件夹）
+        self.ortho_check = QCheckBox("正射影像+地块矢量（不裁剪）:")
+        self.ortho_edit = QLineEdit()
+        self.ortho_btn = QPushButton("浏览")
+        self.ortho_btn.clicked.connect(self.browse_ortho)
+        param_grid.addWidget(self.ortho_check, 13, 0)
+        param_grid.addWidget(self.ortho_edit, 13, 1)
+        param_grid.addWidget(self.ortho_btn, 13, 2)
+
+        self.shp_label = QLabel("地块矢量 (shp):")
+        self.shp_edit = QLineEdit()
+        self.shp_btn = QPushButton("浏览")
+        self.shp_btn.clicked.connect(self.browse_shp)
+        param_grid.addWidget(self.shp_label, 14, 0)
+        param_grid.addWidget(self.shp_edit, 14, 1)
+        param_grid.addWidget(self.shp_btn, 14, 2)
+
+        self.plot_field_label = QLabel("地块名称字段:")
+        self.plot_field_edit = QLineEdit("name")
+        param_grid.addWidget(self.plot_field_label, 15, 0)
+        param_grid.addWidget(self.plot_field_edit, 15, 1, 1, 2)
+
+        # 小地块批量计算：尺寸相近的地块合并为一批计算，减少逐个地块的开销
+        self.batch_check = QCheckBox("小地块批量计算（尺寸相近的地块合并计算，逐像素纹理图不适用）")
+        param_grid.addWidget(self.batch_check, 16, 0, 1, 3)
+
+        # 金字塔降采样：大窗口在降采样影像上用较小窗口近似计算，用于快速筛查
+        self.pyramid_label = QLabel("金字塔降采样:")
+        self.pyramid_combo = QComboBox()
+        self.pyramid_combo.addItem("不使用（原始分辨率）", 1)
+        for factor in PYRAMID_LEVELS:
+            self.pyramid_combo.addItem(f"{factor}x降采样（快速筛查）", factor)
+        self.pyramid_combo.setToolTip("仅用于滑动窗口纹理取均值：窗口和距离按倍数缩小后在降采样影像上计算；"
+                                      "运行报告（texture_run_report.log）给出各层级的耗时和误差对比")
+        param_grid.addWidget(self.pyramid_label, 17, 0)
+        param_grid.addWidget(self.pyramid_combo, 17, 1, 1, 2)
+
         param_group.setLayout(param_grid)
         main_layout.addWidget(param_group)
 
@@ -347,6 +1452,17 @@ class TextureFeatureTab(QWidget):
             self.progress_info.setText(f"已选择目录: {os.path.basename(path)}")
 
 
+    def browse_ortho(self):
+        path, _ = QFileDialog.getOpenFileName(self, "选择正射影像", "", "TIFF文件 (*.tif *.tiff)")
+        if path:
+            self.ortho_edit.setText(path)
+            self.ortho_check.setChecked(True)
+
+    def browse_shp(self):
+        path, _ = QFileDialog.getOpenFileName(self, "选择矢量文件", "", "Shapefile (*.shp)")
+        if path:
+            self.shp_edit.setText(path)
+
     def browse_output_directory(self):
         path = QFileDialog.getExistingDirectory(self, "选择输出文件夹")
         if path:
@@ -358,7 +1474,20 @@ class TextureFeatureTab(QWidget):
     def start_calculation(self):
         root_path = self.dir_edit.text()
         output_path = self.output_edit.text()  # 获取输出路径
-        if not os.path.isdir(root_path):
+        ortho_path = shp_path = None
+        if self.ortho_check.isChecked():
+            ortho_path = self.ortho_edit.text()
+            shp_path = self.shp_edit.text()
+            if not os.path.isfile(ortho_path):
+                QMessageBox.warning(self, "错误", "请选择有效的正射影像")
+                return
+            if not os.path.isfile(shp_path):
+                QMessageBox.warning(self, "错误", "请选择有效的地块矢量文件")
+                return
+            if not self.plot_field_edit.text().strip():
+                QMessageBox.warning(self, "错误", "请填写地块名称字段")
+                return
+        elif not os.path.isdir(root_path):
             QMessageBox.warning(self, "错误", "请选择有效的数据目录")
             return
 
@@ -366,8 +1495,9 @@ class TextureFeatureTab(QWidget):
             QMessageBox.warning(self, "错误", "请选择有效的输出文件夹路径")
             return
 
+        texture_scope = self.scope_combo.currentData()
         selected_windows = [s for s, cb in self.window_checks.items() if cb.isChecked()]
-        if not selected_windows:
+        if texture_scope != 'plot' and not selected_windows:
             QMessageBox.warning(self, "错误", "请至少选择一个窗口尺寸")
             return
 
@@ -376,13 +1506,39 @@ class TextureFeatureTab(QWidget):
             QMessageBox.warning(self, "错误", "请至少选择一个纹理特征")
             return
 
+        selected_steps = [s for s, cb in self.step_checks.items() if cb.isChecked()]
+        if not selected_steps:
+            QMessageBox.warning(self, "错误", "请至少选择一个GLCM距离")
+            return
+
+        band_map = None
+        if self.multiband_check.isChecked():
+            band_map = [name.strip() for name in self.band_map_edit.text().split(',') if name.strip()]
+
         # 启动线程并传递输出路径
-        self.thread = CalculationThread(
-            root_path=root_path,
-            window_sizes=selected_windows,
-            features=selected_features,
-            output_path=output_path  # 传递输出路径
-        )
+        try:
+            self.thread = CalculationThread(
+                root_path=root_path,
+                window_sizes=selected_windows,
+                features=selected_features,
+                output_path=output_path,  # 传递输出路径
+                glcm_mode=self.mode_combo.currentData(),
+                use_mask=self.mask_check.isChecked(),
+                texture_scope=texture_scope,
+                steps=selected_steps,
+                workers=self.workers_spin.value(),
+                band_map=band_map,
+                output_format=self.format_combo.currentData(),
+                resume=self.resume_check.isChecked(),
+                ortho_path=ortho_path,
+                shp_path=shp_path,
+                plot_field=self.plot_field_edit.text().strip(),
+                batch=self.batch_check.isChecked(),
+                pyramid=self.pyramid_combo.currentData()
+            )
+        except ValueError as e:
+            QMessageBox.warning(self, "错误", str(e))
+            return
 
         self.thread.progress_updated.connect(self.update_progress)
         self.thread.calculation_finished.connect(self.calculation_complete)